@@ -0,0 +1,67 @@
+from components.aircraft.Dump1090Parser import Dump1090Parser
+
+import argparse
+import random
+import time
+
+def synthetic_capture(num_lines, num_planes=300):
+    """ SBS-1 lines in roughly the mix dump1090 sends for a busy sky """
+    icao_list = ["{:06X}".format(random.randrange(1<<24)) for i in range(num_planes)]
+    lines = []
+
+    for i in range(num_lines):
+        icao = random.choice(icao_list)
+        date = "2024/05/01"
+        stamp = "{:02d}:{:02d}:{:06.3f}".format(12 + i//3600000, (i//60000)%60, (i/1000)%60)
+        msg_type = random.choice("3333444155")
+
+        fields = ["MSG", msg_type, "1", "1", icao, "1", date, stamp, date, stamp] + [""]*12
+
+        if (msg_type=="1"):
+            fields[10] = "TST{:04d}".format(int(icao, 16)%10000)
+        elif (msg_type=="3"):
+            fields[11] = str(random.randrange(1000, 40000, 25))
+            fields[14] = "{:.5f}".format(random.uniform(50, 53))
+            fields[15] = "{:.5f}".format(random.uniform(-2, 2))
+        elif (msg_type=="4"):
+            fields[12] = str(random.randrange(100, 500))
+            fields[13] = str(random.randrange(0, 360))
+            fields[16] = str(random.randrange(-2000, 2000, 64))
+        else:
+            fields[11] = str(random.randrange(1000, 40000, 25))
+
+        lines.append(",".join(fields) + "\r\n")
+
+    return "".join(lines).encode("ascii")
+
+if __name__=="__main__":
+    arg_parser = argparse.ArgumentParser(description="Measure Dump1090Parser decode throughput")
+    arg_parser.add_argument("capture", nargs="?", help="Recorded SBS-1 stream (eg. nc host 30003 > capture.sbs), synthetic if not given")
+    arg_parser.add_argument("--lines", type=int, default=200000, help="Synthetic capture length")
+    arg_parser.add_argument("--chunk", type=int, default=Dump1090Parser.read_size, help="Bytes handed to the parser per read")
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    if args.capture!=None:
+        with open(args.capture, "rb") as f:
+            capture = f.read()
+    else:
+        capture = synthetic_capture(args.lines)
+
+    best_rate = 0.0
+    for run in range(args.repeat):
+        parser = Dump1090Parser("127.0.0.1", 30003)
+        num_messages = 0
+
+        start = time.perf_counter()
+        for offset in range(0, len(capture), args.chunk):
+            messages = parser.decode_lines(capture[offset:offset + args.chunk])
+            parser.apply_messages(messages)
+            num_messages += len(messages)
+        elapsed = time.perf_counter() - start
+
+        rate = num_messages/elapsed
+        best_rate = max(rate, best_rate)
+        print("Run {}: {} messages, {} planes in {:.3f} s, {:.0f} messages/s".format(run, num_messages, len(parser.aircraft), elapsed, rate))
+
+    print("Best: {:.0f} messages/s".format(best_rate))
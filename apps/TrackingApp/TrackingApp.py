@@ -8,9 +8,11 @@ from ...components.aircraft.Dump1090Parser import Dump1090Parser
 from ...components.aircraft.FlightRadarParser import FlightRadarParser
 from ...components.aircraft.AircraftManager import AircraftManager
 from ...components.tracking.ObjectTracker import ObjectTracker
+from ...components.tracking.TrackingEngine import TrackingEngine
 from ...components.aircraft.TrackableAircraft import TrackableAircraft
 from ...components.transformer.LocalCoordinateTransformer import LocalCoordinateTransformer
 from ...components.interface.WebScope import WebScope
+from ...components.interface.ScopeCommandChannel import ScopeCommandChannel
 from ...components.calibration.CalibrationManager import CalibrationManager
 from ...components.solver.MountModel import MountModel
 
@@ -26,6 +28,9 @@ import os
 import logging
 
 class TrackingApp(QtWidgets.QMainWindow):
+	#Carries (TrackingStatus, engine stats) from the tracking thread
+	tracking_status_signal = QtCore.Signal(object, object)
+
 	def __init__(self):
 		super().__init__()
 
@@ -73,13 +78,10 @@ class TrackingApp(QtWidgets.QMainWindow):
 		except OSError as err:
 			logging.warning("Failed to write config file to disk, error: {0}".format(err))
 
-	@QtCore.Slot()
-	def tracking_loop(self):
-		#run tracker
-		self.tracker.run()
-
+	@QtCore.Slot(object, object)
+	def tracking_status_update(self, status, engine_stats):
 		#update tracking display
-		self.tracking_widget.update()
+		self.tracking_widget.show_status(status, engine_stats)
 
 	@QtCore.Slot(str)
 	def plane_select(self, icao_address):
@@ -116,7 +118,11 @@ class TrackingApp(QtWidgets.QMainWindow):
 
 		self.transformer = LocalCoordinateTransformer(self.config["location"])
 		self.driver = WebScope("http://127.0.0.1:5000/api/v1/telescope/0")
-		self.tracker = ObjectTracker(self.transformer, self.driver)
+
+		#Commands go out from a worker thread, so a slow driver can't stall the GUI
+		self.scope_channel = ScopeCommandChannel(self.driver)
+		self.tracker = ObjectTracker(self.transformer, self.scope_channel)
+		self.tracker.set_tracking_mode(self.config.get("tracking_mode", ObjectTracker.MODE_POSITION))
 
 		self.alpaca_server = AlpacaServer
 
@@ -124,15 +130,18 @@ class TrackingApp(QtWidgets.QMainWindow):
 
 		self.tracking_widget.set_object_tracker(self.tracker)
 		self.chooser_widget.set_aircraft_manager(self.manager)
+		self.chooser_widget.set_object_tracker(self.tracker)
 		self.chooser_widget.plane_selected_siganl.connect(self.plane_select)
 		self.offset_widget.set_tracker(self.tracker)
 		self.calibration_widget.set_calibration_manager(self.calibration_manager)
 
 		self.alpaca_server.start_server()
 
-		self.timer = QtCore.QTimer()
-		self.timer.timeout.connect(self.tracking_loop)
-		self.timer.start(200)
+		#Tracking runs on its own thread, the GUI just gets status updates
+		self.tracking_status_signal.connect(self.tracking_status_update)
+
+		self.tracking_engine = TrackingEngine(self.tracker, rate_hz=self.config.get("tracking_rate_hz", 20.0), callback=self.tracking_status_signal.emit)
+		self.tracking_engine.start()
 
 	def init_layout(self):
 		self.tracking_widget = TrackingStatusWidget()
@@ -255,7 +264,9 @@ if __name__=="__main__":
 	widget.show()
 	app.exec_()
 
+	widget.tracking_engine.stop()
 	widget.manager.stop_update_loop()
+	widget.scope_channel.close()
 	time.sleep(1)
 
 	exit()
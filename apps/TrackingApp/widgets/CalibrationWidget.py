@@ -44,7 +44,7 @@ class CalibrationWidget(QtWidgets.QWidget):
 			self.calibration_manager.capture_point()
 
 			avg_err = self.calibration_manager.update_model(update_tracker=False)
-			self.set_status("Solver error: " + str(avg_err))
+			self.set_status("Solver error: {:.4f} deg".format(avg_err))
 
 			self.update_point_list()
 			self.set_calibration_data()
@@ -77,6 +77,10 @@ class CalibrationWidget(QtWidgets.QWidget):
 			index = 0
 			for cal_point in point_list:
 				point_text = "{index:d}: {p.object_name:s} - {p.reprojection_error:.4f}".format(index=index, p=cal_point)
+
+				if cal_point.is_outlier:
+					point_text += " (outlier)"
+
 				list_item = QtWidgets.QListWidgetItem(point_text, view=self.list_widget)
 
 				list_item.setData(QtCore.Qt.UserRole, index)
@@ -2,11 +2,16 @@
 
 from PySide2 import QtCore, QtWidgets, QtGui
 
+import numpy as np
+
 class PlaneChooserWidget(QtWidgets.QWidget):
 
     #Reference to the plane source
     aircraft_manager = None
 
+    #Object tracker used to rank planes by slew cost, optional
+    object_tracker = None
+
     #dictionary of planes
     planes = None
 
@@ -36,6 +41,9 @@ class PlaneChooserWidget(QtWidgets.QWidget):
     def set_aircraft_manager(self, aircraft_manager):
         self.aircraft_manager = aircraft_manager
 
+    def set_object_tracker(self, object_tracker):
+        self.object_tracker = object_tracker
+
     def set_callback(self, callback):
         self.callback = callback
 
@@ -71,11 +79,33 @@ class PlaneChooserWidget(QtWidgets.QWidget):
             self.planes = {}
 
         self.plane_list_widget.clear()
-        for icao_address, plane in self.planes.items():
+
+        icao_list = [icao_address for icao_address, plane in self.planes.items() if plane.position!=None and plane.altitude!=None]
+        costs = {}
+        reachable = {}
+
+        #Rank the whole fleet by how far the mount has to slew to each plane
+        if (self.object_tracker!=None and len(icao_list) > 0):
+            pos_arr = np.array([self.planes[icao_address].get_metric_pos() for icao_address in icao_list])
+
+            rots_arr, plane_costs, plane_reachable = self.object_tracker.rank_positions(pos_arr)
+
+            costs = dict(zip(icao_list, plane_costs))
+            reachable = dict(zip(icao_list, plane_reachable))
+
+        for icao_address in sorted(self.planes.keys(), key=lambda icao: (not reachable.get(icao, True), costs.get(icao, np.inf))):
+            plane = self.planes[icao_address]
+
             text = icao_address
             if plane.callsign!=None:
                 text += " (" + plane.callsign + ")"
 
+            if icao_address in costs:
+                if reachable[icao_address]:
+                    text += " - {:.1f} deg".format(costs[icao_address])
+                else:
+                    text += " - unreachable"
+
             item = QtWidgets.QListWidgetItem(text, view=self.plane_list_widget)
             item.setData(QtCore.Qt.UserRole, icao_address)
 
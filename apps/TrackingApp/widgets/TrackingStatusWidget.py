@@ -2,7 +2,6 @@
 
 from PySide2 import QtCore, QtWidgets, QtGui
 
-import math
 
 class TrackingStatusWidget(QtWidgets.QWidget):
 
@@ -18,45 +17,24 @@ class TrackingStatusWidget(QtWidgets.QWidget):
         self.update()
 
     def update(self):
-        tracking_label = None
-        tracking_latlong = [0.0, 0.0]
-        tracking_altitude = 0.0
-        tracking_altaz = [0.0, 0.0]
-        tracking_distance = 0.0
-        tracking_offset = [0.0, 0.0]
-
         if (self.object_tracker!=None):
-            trackable = self.object_tracker.get_tracked_object()
-
-            if (trackable!=None):
-                pos = trackable.get_position()
-
-                if (pos!=None):
-                    last_motor_angle = self.object_tracker.get_last_motor_angle()
-
-                    tracking_label = trackable.get_name()
-
-                    if (pos.pos_type==pos.TYPE_LATLONG):
-                        tracking_latlong = (pos.lat, pos.long)
-                        tracking_altitude = pos.height
-
-                    #Calculate object distance
-                    local_pos = self.object_tracker.get_trackable_position()
-
-                    if (local_pos.pos_type == local_pos.TYPE_CARTESIAN):
-                        tracking_distance = math.sqrt(local_pos.x*local_pos.x + local_pos.y*local_pos.y + local_pos.z*local_pos.z)
-
-                    tracking_altaz = last_motor_angle
+            self.show_status(self.object_tracker.get_status())
+        else:
+            self.update_labels(None, [0.0, 0.0], 0.0, [0.0, 0.0], 0.0, [0.0, 0.0], (0.0, 0.0, 0.0))
 
-            tracking_offset = self.object_tracker.get_tracking_offset()
-            
+    def show_status(self, status, engine_stats=None):
+        """ display an ObjectTracker.TrackingStatus, and the TrackingEngine
+        stats if given """
+        self.update_labels(status.label, status.latlong, status.altitude, status.altaz, status.distance, status.offset, status.lead)
 
-        self.update_labels(tracking_label, tracking_latlong, tracking_altitude, tracking_altaz, tracking_distance, tracking_offset)
+        if (engine_stats!=None):
+            self.loop_value.setText("{:.1f} Hz, {:.1f} ms jitter, {} overruns".format(
+                engine_stats["actual_hz"], engine_stats["mean_jitter_ms"], engine_stats["overruns"]))
 
     def set_object_tracker(self, object_tracker):
         self.object_tracker = object_tracker
 
-    def update_labels(self, label, latlong, altitude, altaz, distance, offset):
+    def update_labels(self, label, latlong, altitude, altaz, distance, offset, lead):
         if label==None:
             self.tracking_value.setText("<html><head/><body><p><span style=\" font-weight:600; color:#af2538;\">None</span></p></body></html>")
         else:
@@ -67,6 +45,7 @@ class TrackingStatusWidget(QtWidgets.QWidget):
         self.altaz_value.setText("{:.4f}, {:.4f}".format(altaz[0], altaz[1]))
         self.distance_value.setText("{:.1f} m".format(distance))
         self.offset_value.setText("{:.4f}, {:.4f}".format(offset[0], offset[1]))
+        self.lead_value.setText("{:.0f} ms: {:.4f}, {:.4f}".format(lead[0]*1000.0, lead[1], lead[2]))
 
     def init_layout(self):
         self.verticalLayout = QtWidgets.QVBoxLayout(self)
@@ -138,6 +117,26 @@ class TrackingStatusWidget(QtWidgets.QWidget):
         self.offset_value.setObjectName("offset_value")
         self.formLayout.setWidget(5, QtWidgets.QFormLayout.FieldRole, self.offset_value)
 
+        #Line 6
+        self.lead_title = QtWidgets.QLabel(self.group_box)
+        self.lead_title.setObjectName("lead_title")
+        self.formLayout.setWidget(6, QtWidgets.QFormLayout.LabelRole, self.lead_title)
+
+        self.lead_value = QtWidgets.QLabel(self.group_box)
+        self.lead_value.setAlignment(QtCore.Qt.AlignRight|QtCore.Qt.AlignTrailing|QtCore.Qt.AlignVCenter)
+        self.lead_value.setObjectName("lead_value")
+        self.formLayout.setWidget(6, QtWidgets.QFormLayout.FieldRole, self.lead_value)
+
+        #Line 7
+        self.loop_title = QtWidgets.QLabel(self.group_box)
+        self.loop_title.setObjectName("loop_title")
+        self.formLayout.setWidget(7, QtWidgets.QFormLayout.LabelRole, self.loop_title)
+
+        self.loop_value = QtWidgets.QLabel(self.group_box)
+        self.loop_value.setAlignment(QtCore.Qt.AlignRight|QtCore.Qt.AlignTrailing|QtCore.Qt.AlignVCenter)
+        self.loop_value.setObjectName("loop_value")
+        self.formLayout.setWidget(7, QtWidgets.QFormLayout.FieldRole, self.loop_value)
+
 
         
         self.group_box.setLayout(self.formLayout)
@@ -150,6 +149,8 @@ class TrackingStatusWidget(QtWidgets.QWidget):
         self.altaz_title.setText("Alt, Az: ")
         self.distance_title.setText("Distance: ")
         self.offset_title.setText("Offset: ")
+        self.lead_title.setText("Lead: ")
+        self.loop_title.setText("Loop: ")
         
 
 if __name__=="__main__":
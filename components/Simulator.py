@@ -157,16 +157,11 @@ class Simulator:
 
 		#Use the calibrated model to solve the points
 		calibrated_rots = np.zeros((num_points, 2))
-		scope_errors = np.zeros((num_points))
 
 		for i in range(test_points.shape[0]):
 			#Find the calibrated model drive angles for each point
 			calibrated_rots[i], result, scope_error = calibrated_solver.solve(test_points[i])
 
-			#Find the real world scope error of using the calibrated model
-			# drive angles
-			scope_errors[i] = self.pointing_solver.scope_error(calibrated_rots[i], test_points[i])
-
 			if not result.success:
 				print("ERROR when solving")
 				print("point: " + str(test_points[i]))
@@ -174,6 +169,10 @@ class Simulator:
 
 				print(result)
 
+		#Find the real world scope error of using the calibrated model
+		# drive angles
+		scope_errors = self.pointing_solver.scope_errors(calibrated_rots, test_points)
+
 		# Calculate error statistics
 		mse = np.average(np.power(calibrated_rots-test_rots, 2))
 		avg_scope_err = np.average(scope_errors)
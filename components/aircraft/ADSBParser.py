@@ -1,5 +1,6 @@
 """ module implementing abstract ADSBParser class"""
 
+from ..aircraft.ExpiryIndex import ExpiryIndex
 import asyncio
 
 class ADSBParser:
@@ -15,9 +16,24 @@ class ADSBParser:
 
     clear_aircraft_flag = False
 
+    #Set of ICAO addresses changed since get_changed_aircraft was last
+    #called, None if the parser doesn't track changes
+    changed_aircraft = None
+
+    #Planes not heard from in this long (s) are dropped by expire_aircraft
+    drop_after_s = 300.0
+
+    #ExpiryIndex of when each plane was last heard from, for parsers
+    #that accumulate planes rather than resending their whole list
+    expiry = None
+
+    #Count of planes dropped for age
+    num_evicted = 0
+
     def __init__(self):
         self.aircraft = {}
         self.aircraft_lock = asyncio.Lock()
+        self.expiry = ExpiryIndex()
 
     async def message_loop(self):
         """ async loop for fetching messages from the data source """
@@ -29,5 +45,41 @@ class ADSBParser:
 
         return self.aircraft
 
+    def get_changed_aircraft(self):
+        """ MUST be called from an async method
+        taking the aircraft dictionary lock. Gets a dictionary of the
+        planes changed since the last call, or every plane if the
+        parser doesn't track changes"""
+
+        changed = self.changed_aircraft
+
+        if changed==None:
+            return self.aircraft
+
+        self.changed_aircraft = set()
+
+        return {icao_address: self.aircraft[icao_address] for icao_address in changed if icao_address in self.aircraft}
+
+    def mark_changed(self, old_plane, new_plane):
+        """ Record new_plane as changed if it differs from old_plane
+        (None for a newly seen plane) """
+
+        if (old_plane==None or not old_plane.same_report(new_plane)):
+            self.changed_aircraft.add(new_plane.icao_address)
+
+    def expire_aircraft(self, time):
+        """ MUST be called holding the aircraft dictionary lock.
+        Drops planes not heard from in drop_after_s """
+
+        for icao_address in self.expiry.pop_expired(time - self.drop_after_s):
+            self.remove_aircraft(icao_address)
+            self.num_evicted += 1
+
+    def remove_aircraft(self, icao_address):
+        self.aircraft.pop(icao_address, None)
+
+        if self.changed_aircraft!=None:
+            self.changed_aircraft.discard(icao_address)
+
     def clear_aircraft(self):
         self.clear_aircraft_flag = True
\ No newline at end of file
@@ -13,25 +13,55 @@ dtr = math.pi / 180.0
 class Aircraft:
 	""" Class to represent aircraft"""
 
-	#Current GPS position
-	position = None
-	last_pos_update = None
-
-	#Altitude
-	altitude = None
-	#Last known ground speed and heading
-	ground_speed = None
-	ground_heading = None
-
-	vertical_speed = None
-	#Time in s of last state vector update
-	last_vector_update = None
-
-	icao_address = None
-	callsign = None
+	__slots__ = (
+		"position",
+		"last_pos_update",
+		"last_act_pos",
+		"altitude",
+		"ground_speed",
+		"ground_heading",
+		"vertical_speed",
+		"last_vector_update",
+		"icao_address",
+		"callsign"
+	)
 
 	def __init__(self):
-		pass
+		#Current GPS position
+		self.position = None
+		self.last_pos_update = None
+		self.last_act_pos = None
+
+		#Altitude
+		self.altitude = None
+		#Last known ground speed and heading
+		self.ground_speed = None
+		self.ground_heading = None
+
+		self.vertical_speed = None
+		#Time in s of last state vector update
+		self.last_vector_update = None
+
+		self.icao_address = None
+		self.callsign = None
+
+	def copy(self):
+		""" Shallow copy, every field is immutable so this is
+		all a snapshot needs """
+		plane = Aircraft()
+
+		for name in Aircraft.__slots__:
+			setattr(plane, name, getattr(self, name))
+
+		return plane
+
+	def same_report(self, other):
+		""" True if other carries the same position and state vector,
+		ignoring when it was received """
+		return (self.position==other.position and self.last_pos_update==other.last_pos_update and
+			self.altitude==other.altitude and self.ground_speed==other.ground_speed and
+			self.ground_heading==other.ground_heading and self.vertical_speed==other.vertical_speed and
+			self.callsign==other.callsign)
 
 	def can_calc_update(self):
 		return self.last_pos_update!=None and self.ground_speed!=None and self.ground_heading!=None and self.altitude!=None and self.vertical_speed!=None
@@ -97,7 +127,7 @@ class Aircraft:
 			new_Lat = -180.0 - new_Lat
 		
 		if (new_Long < -180.0):
-			new_Long = 360.0 - new_Long
+			new_Long = 360.0 + new_Long
 		elif (new_Long > 180.0):
 			new_Long = -360.0 + new_Long
 
@@ -1,25 +1,53 @@
 """ module to contain AircraftManager class"""
 
 from ..aircraft.Aircraft import Aircraft
+from ..aircraft.FleetStore import FleetStore, FleetSnapshot
+from ..aircraft.ExpiryIndex import ExpiryIndex
 import time
 import logging
 import asyncio
 import threading
-import copy
 
 class AircraftManager:
 	""" class to manage and update aircraft positions """
 
 	aircraft_source = None
 
-	#dictionary to store aircraft
-	aircraft = None
-	#thread level lock for dictionary access
+	#FleetStore holding the aircraft state
+	fleet = None
+	#Latest published FleetSnapshot, readers use this without locking
+	snapshot = None
+	#thread level lock for fleet access by the update loops
 	aircraft_lock = None
 	#asyncio lock for own dictionary access
 	async_aircraft_lock = None
 
+	#Rate (ms) subscribed planes are propagated at
 	motion_model_rate_ms = 10.0
+	#Rate (ms) the rest of the fleet is propagated at, readers
+	#dead reckon to the time they read in between
+	background_rate_ms = 1000.0
+
+	#ICAO address to subscriber count, the planes to keep fresh
+	subscriptions = None
+	#thread level lock for subscriptions
+	subscription_lock = None
+
+	#Time (s) of the last whole fleet motion update
+	last_background_update = 0.0
+
+	#Planes not heard from in this long (s) stop being propagated
+	stale_after_s = 60.0
+	#and after this long (s) are dropped
+	drop_after_s = 300.0
+
+	#Time ordered ExpiryIndexes of when each plane was last heard from,
+	#holding the planes yet to go stale or be dropped respectively
+	stale_index = None
+	drop_index = None
+
+	#Count of planes dropped for age
+	num_evicted = 0
 
 	#Switch to command shutdown of the update thread
 	run_update_thread = False
@@ -27,10 +55,17 @@ class AircraftManager:
 	def __init__(self, aircraft_source):
 		self.aircraft_source = aircraft_source
 
-		self.aircraft = {}
+		self.fleet = FleetStore()
+		self.snapshot = FleetSnapshot.empty()
 		self.aircraft_lock = threading.Lock()
 		self.async_aircraft_lock = asyncio.Lock()
 
+		self.stale_index = ExpiryIndex()
+		self.drop_index = ExpiryIndex()
+
+		self.subscriptions = {}
+		self.subscription_lock = threading.Lock()
+
 		#WARNING this is for the nasty update function hack!
 		#self.event_loop = None
 
@@ -45,26 +80,33 @@ class AircraftManager:
 				async with self.async_aircraft_lock:
 					#Acquire thread level lock
 					with self.aircraft_lock:
-						#Get REFERENCE to plane data from source
-						new_aircraft = self.aircraft_source.get_aircraft()
+						#Only the planes the source has changed since the last poll
+						new_aircraft = self.aircraft_source.get_changed_aircraft()
 
 						cur_time = time.time()
 
-						#Loop through the source planes
+						#Loop through the changed source planes
 						for icao_address, plane in new_aircraft.items():
-							
-							if (self.aircraft.get(icao_address)==None):
+							if (icao_address not in self.fleet):
 								#New plane with position, copy it in
 								if plane.last_pos_update!=None:
-									self.aircraft[icao_address] = copy.deepcopy(plane)
+									self.fleet.set(plane)
 									print("New plane: " + icao_address)
 									print(plane)
+								else:
+									continue
 							else:
 								#Existing plane, merge the new data, possibly doing
 								#a motion update
-								self.aircraft[icao_address].merge(plane, cur_time)
+								self.fleet.merge(plane, cur_time)
 								#print("Merge: " + icao_address)
 
+							self.stale_index.touch(icao_address, cur_time)
+							self.drop_index.touch(icao_address, cur_time)
+
+						if len(new_aircraft) > 0:
+							self.publish_snapshot(cur_time)
+
 			#Sleep for source poll interval
 			await asyncio.sleep(self.aircraft_source.poll_interval_ms / 1000.0)
 
@@ -76,10 +118,24 @@ class AircraftManager:
 				with self.aircraft_lock:
 					cur_time = time.time()
 
-					#Do a motion update for all our planes
-					for plane in self.aircraft.values():
-						if (plane.can_calc_update()):
-							plane.update(cur_time)
+					changed = self.expire_planes(cur_time)
+
+					if cur_time - self.last_background_update >= self.background_rate_ms / 1000.0:
+						#Do a motion update for all our live planes in one step
+						self.fleet.propagate(cur_time)
+						self.last_background_update = cur_time
+						changed = True
+					else:
+						with self.subscription_lock:
+							subscribed = list(self.subscriptions)
+
+						#Just keep the subscribed planes fresh
+						if len(subscribed) > 0:
+							self.fleet.propagate(cur_time, self.fleet.rows_of(subscribed))
+							changed = True
+
+					if changed:
+						self.publish_snapshot(cur_time)
 
 			#Sleep for motion update interval
 			await asyncio.sleep(self.motion_model_rate_ms / 1000.0)
@@ -100,35 +156,99 @@ class AircraftManager:
 	def stop_update_loop(self):
 		self.run_update_thread = False
 
-	def get_plane(self, icao_address):
-		plane = None
-		
-		with self.aircraft_lock:
-			plane = copy.deepcopy(self.aircraft.get(icao_address))
+	def expire_planes(self, cur_time):
+		""" Mark planes not heard from in stale_after_s as stale, and drop
+		those not heard from in drop_after_s. MUST be called holding
+		the aircraft lock. Returns whether any plane changed """
 
-		return plane
+		stale = self.stale_index.pop_expired(cur_time - self.stale_after_s)
+		dropped = self.drop_index.pop_expired(cur_time - self.drop_after_s)
 
-	def get_planes(self):
-		planes = None
+		for icao_address in stale:
+			self.fleet.set_stale(icao_address)
 
-		with self.aircraft_lock:
-			planes = copy.deepcopy(self.aircraft)
+		for icao_address in dropped:
+			self.fleet.remove(icao_address)
+			self.stale_index.discard(icao_address)
+			self.num_evicted += 1
 
-		return planes
+		return len(stale) > 0 or len(dropped) > 0
 
-	def get_plane_list(self):
-		plane_list = None
+	def subscribe(self, icao_address):
+		""" Keep icao_address propagated at the high motion model rate,
+		until a matching unsubscribe """
+		with self.subscription_lock:
+			self.subscriptions[icao_address] = self.subscriptions.get(icao_address, 0) + 1
 
-		with self.aircraft_lock:
-			plane_list = [icao_address for icao_address in self.aircraft.keys()]
+	def unsubscribe(self, icao_address):
+		with self.subscription_lock:
+			count = self.subscriptions.get(icao_address, 0) - 1
+
+			if count > 0:
+				self.subscriptions[icao_address] = count
+			else:
+				self.subscriptions.pop(icao_address, None)
+
+	def get_expiry_stats(self):
+		snapshot = self.snapshot
+		num_stale = snapshot.count_stale()
+
+		return {
+			"active": len(snapshot) - num_stale,
+			"stale": num_stale,
+			"evicted": self.num_evicted,
+			"source_evicted": self.aircraft_source.num_evicted
+		}
+
+	def publish_snapshot(self, cur_time):
+		""" Swap in a new snapshot of the fleet. MUST be called
+		holding the aircraft lock """
+
+		#A single reference assignment, so readers see either the
+		#old or the new snapshot, never a partial one
+		self.snapshot = self.fleet.snapshot(self.snapshot.version + 1, cur_time)
+
+	def get_snapshot(self):
+		""" Latest immutable FleetSnapshot """
+		return self.snapshot
+
+	def has_changed(self, version, layout_only=False):
+		""" Whether a newer snapshot than version has been published.
+		With layout_only, only count planes being added, removed or
+		renamed, version then being a layout_version """
+		snapshot = self.snapshot
+
+		if layout_only:
+			return snapshot.layout_version != version
 
-		return plane_list
+		return snapshot.version != version
+
+	def get_plane(self, icao_address):
+		return self.snapshot.get(icao_address, time.time())
+
+	def has_plane(self, icao_address):
+		return icao_address in self.snapshot
+
+	def get_plane_position(self, icao_address):
+		""" Lat/Long/metric height of a plane, or None if it has
+		no position """
+		return self.snapshot.get_metric_pos(icao_address, time.time())
+
+	def get_planes(self):
+		return self.snapshot.get_all(time.time())
+
+	def get_plane_list(self):
+		return list(self.snapshot.icao_list)
 
 	def clear_plane_list(self):
 		with self.aircraft_lock:
-			self.aircraft = {}
+			self.fleet.clear()
+			self.stale_index.clear()
+			self.drop_index.clear()
 			self.aircraft_source.clear_aircraft()
 
+			self.publish_snapshot(time.time())
+
 	# def update(self):
 	# 	"""WARNING, for god's sake don't use this function again,
 	# 	it's hacked together to support the new async stuff"""
@@ -170,9 +290,11 @@ class AircraftManager:
 if __name__=="__main__":
 	from ..aircraft.RTL1090Parser import RTL1090Parser
 	from ..aircraft.Dump1090Parser import Dump1090Parser
+	from ..aircraft.BeastParser import BeastParser
 
 	#parser = RTL1090Parser("http://127.0.0.1:31008/table2")
 	parser = Dump1090Parser("127.0.0.1", 30003)
+	#parser = BeastParser("127.0.0.1", 30005)
 	manager = AircraftManager(parser)
 
 	update_thread = threading.Thread(target = manager.enter_update_loop)
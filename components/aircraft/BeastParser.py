@@ -0,0 +1,430 @@
+""" Module to decode the dump1090 Beast binary Mode-S stream """
+from ..aircraft.Aircraft import Aircraft
+from ..aircraft.ADSBParser import ADSBParser
+import numpy as np
+import asyncio
+import math
+import time as t
+
+#Beast frame escape/start byte
+BEAST_ESC = 0x1a
+
+#Payload length of each Beast frame type (Mode A/C, Mode-S short, Mode-S long)
+BEAST_FRAME_LENGTHS = {
+    ord("1"): 2,
+    ord("2"): 7,
+    ord("3"): 14
+}
+
+#Beast timestamps count a 12MHz clock
+BEAST_CLOCK_HZ = 12e6
+
+#Mode-S parity polynomial
+CRC24_POLY = 0xFFF409
+
+def make_crc24_table():
+    table = []
+    for i in range(256):
+        crc = i << 16
+        for bit in range(8):
+            if (crc & 0x800000):
+                crc = (crc << 1) ^ CRC24_POLY
+            else:
+                crc = crc << 1
+        table.append(crc & 0xFFFFFF)
+
+    return table
+
+crc24_table = make_crc24_table()
+
+def crc24(data):
+    """ Mode-S CRC-24 remainder of data (bytes) """
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFF) ^ crc24_table[((crc >> 16) ^ byte) & 0xFF]
+
+    return crc
+
+#ADS-B identification character set, # is unused
+callsign_chars = "#ABCDEFGHIJKLMNOPQRSTUVWXYZ##### ###############0123456789######"
+
+#Number of CPR latitude zones between equator and pole
+CPR_NZ = 15
+
+#CPR lat/long fields are 17 bit fractions
+CPR_SCALE = float(1 << 17)
+
+#Even and odd frames further apart than this aren't paired
+CPR_MAX_PAIR_AGE_S = 10.0
+
+def cpr_nl(lat):
+    """ Number of CPR longitude zones at each latitude (deg) in array lat """
+    lat = np.abs(np.asarray(lat, dtype=np.float64))
+
+    a = 1.0 - math.cos(math.pi / (2.0 * CPR_NZ))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        b = np.cos(np.pi / 180.0 * lat)**2
+        nl = np.floor(2.0 * np.pi / np.arccos(1.0 - a / b))
+
+    nl = np.where(lat < 87.0, nl, 1.0)
+    nl = np.where(lat == 87.0, 2.0, nl)
+    nl = np.where(lat == 0.0, 59.0, nl)
+
+    return nl
+
+def cpr_decode_global(lat_even, lon_even, lat_odd, lon_odd, odd_newest):
+    """ Globally unambiguous CPR decode of arrays of even/odd frame pairs.
+    Inputs are the raw 17 bit fields, odd_newest selects the frame
+    the position is reported for. Returns (lat, long, valid) arrays """
+    lat_even = np.asarray(lat_even, dtype=np.float64) / CPR_SCALE
+    lon_even = np.asarray(lon_even, dtype=np.float64) / CPR_SCALE
+    lat_odd = np.asarray(lat_odd, dtype=np.float64) / CPR_SCALE
+    lon_odd = np.asarray(lon_odd, dtype=np.float64) / CPR_SCALE
+    odd_newest = np.asarray(odd_newest, dtype=bool)
+
+    dlat_even = 360.0 / (4 * CPR_NZ)
+    dlat_odd = 360.0 / (4 * CPR_NZ - 1)
+
+    #Latitude zone index
+    j = np.floor(59.0 * lat_even - 60.0 * lat_odd + 0.5)
+
+    lat_e = dlat_even * (np.mod(j, 60.0) + lat_even)
+    lat_o = dlat_odd * (np.mod(j, 59.0) + lat_odd)
+
+    lat_e = np.where(lat_e >= 270.0, lat_e - 360.0, lat_e)
+    lat_o = np.where(lat_o >= 270.0, lat_o - 360.0, lat_o)
+
+    nl_e = cpr_nl(lat_e)
+    nl_o = cpr_nl(lat_o)
+
+    #Frames straddling a zone boundary can't be decoded together
+    valid = nl_e == nl_o
+
+    lat = np.where(odd_newest, lat_o, lat_e)
+    nl = np.where(odd_newest, nl_o, nl_e)
+
+    ni = np.maximum(nl - odd_newest, 1.0)
+    m = np.floor(lon_even * (nl - 1.0) - lon_odd * nl + 0.5)
+
+    lon = (360.0 / ni) * (np.mod(m, ni) + np.where(odd_newest, lon_odd, lon_even))
+    lon = np.where(lon >= 180.0, lon - 360.0, lon)
+
+    return lat, lon, valid
+
+def decode_altitude(alt_field):
+    """ Barometric altitude (ft) of a 12 bit airborne position altitude
+    field, None for Gillham coded or missing altitudes """
+    if (alt_field==0 or (alt_field & 0x10)==0):
+        return None
+
+    #Drop the Q bit to leave an 11 bit count of 25ft
+    n = ((alt_field & 0xFE0) >> 1) | (alt_field & 0x0F)
+
+    return n * 25.0 - 1000.0
+
+class BeastParser(ADSBParser):
+    """ Class to decode dump1090 Beast binary output (port 30005). DF17/18
+    identification, airborne position and velocity messages are decoded
+    directly, frames are timestamped from the receiver's 12MHz clock """
+
+    #asyncio stream reader/writer combo for TCP socket
+    sock_reader = None
+    sock_writer = None
+
+    #Most bytes to take from the socket per message_loop call
+    read_size = 65536
+
+    #Bytes of an incomplete frame left over from the last read
+    partial_frame = b""
+
+    #Wall clock minus receiver clock (s), None until the first timestamped frame
+    clock_offset = None
+
+    #Re-sync the receiver clock if it drifts this far (s) from the wall clock
+    clock_resync_s = 1.0
+
+    def __init__(self, addr, port=30005):
+        super().__init__()
+
+        self.addr = addr
+        self.port = port
+        self.poll_interval_ms = 0
+
+        self.changed_aircraft = set()
+
+        #Latest even and odd CPR frame of each plane as [even, odd], each a
+        #(lat_cpr, lon_cpr, time) tuple or None
+        self.cpr_frames = {}
+
+        #Frame counters
+        self.num_frames = 0
+        self.num_bad_crc = 0
+
+    async def message_loop(self):
+        """ reads everything the socket has buffered, decodes the
+        frames in it, and applies them at once """
+        if (self.sock_reader==None or self.sock_writer==None):
+            try:
+                self.sock_reader, self.sock_writer = await asyncio.open_connection(self.addr, self.port)
+                self.partial_frame = b""
+            except ConnectionRefusedError:
+                print("Beast connection refused")
+                await asyncio.sleep(1)
+                return
+
+        data = await self.sock_reader.read(self.read_size)
+
+        if len(data)==0:
+            print("Beast connection closed")
+            self.sock_writer.close()
+            self.sock_reader = None
+            self.sock_writer = None
+            return
+
+        frames = self.decode_frames(data, t.time())
+
+        if len(frames)==0:
+            return
+
+        async with self.aircraft_lock:
+            if self.clear_aircraft_flag:
+                self.aircraft = {}
+                self.cpr_frames = {}
+                self.changed_aircraft = set()
+                self.expiry.clear()
+                self.clear_aircraft_flag = False
+
+            self.apply_frames(frames)
+            self.expire_aircraft(t.time())
+
+    def decode_frames(self, data, receive_time):
+        """ Split a chunk of the Beast stream into (time, message) pairs
+        of the DF17/18 frames with good parity, keeping any partial
+        frame for the next chunk """
+        buf = self.partial_frame + data
+        end = len(buf)
+        frames = []
+
+        pos = buf.find(BEAST_ESC)
+        while pos!=-1 and pos + 1 < end:
+            length = BEAST_FRAME_LENGTHS.get(buf[pos + 1])
+
+            if (length==None):
+                #Escaped data byte or unknown frame type, resync on the next start
+                pos = buf.find(BEAST_ESC, pos + 2)
+                continue
+
+            #6 byte timestamp, signal level and message
+            body_length = 7 + length
+            body = buf[pos + 2:pos + 2 + body_length]
+            next_pos = pos + 2 + body_length
+
+            if (BEAST_ESC in body):
+                body, next_pos = self.unescape(buf, pos + 2, body_length)
+
+                if (body==None):
+                    break
+            elif (len(body) < body_length):
+                break
+
+            pos = next_pos
+            self.num_frames += 1
+
+            msg = body[7:]
+            if (length!=14 or (msg[0] >> 3) not in (17, 18)):
+                #Only extended squitters carry position
+                pos = buf.find(BEAST_ESC, pos)
+                continue
+
+            if (crc24(msg)!=0):
+                self.num_bad_crc += 1
+                pos = buf.find(BEAST_ESC, pos)
+                continue
+
+            frames.append((self.frame_time(int.from_bytes(body[:6], "big"), receive_time), msg))
+
+            pos = buf.find(BEAST_ESC, pos)
+
+        if (pos==-1):
+            self.partial_frame = b""
+        else:
+            self.partial_frame = buf[pos:]
+
+        return frames
+
+    def unescape(self, buf, start, length):
+        """ Read length bytes of frame body from buf at start, collapsing
+        doubled escape bytes. Returns (body, end) or (None, None) if
+        the frame isn't complete yet """
+        body = bytearray()
+        pos = start
+        end = len(buf)
+
+        while len(body) < length:
+            if (pos >= end):
+                return None, None
+
+            byte = buf[pos]
+            if (byte==BEAST_ESC):
+                if (pos + 1 >= end):
+                    return None, None
+
+                pos += 1
+
+            body.append(byte)
+            pos += 1
+
+        return bytes(body), pos
+
+    def frame_time(self, ticks, receive_time):
+        """ Unix time of a frame with receiver timestamp ticks, received
+        at receive_time. The receiver clock is mapped onto the wall clock
+        using the least delayed frame seen """
+        if (ticks==0):
+            return receive_time
+
+        offset = receive_time - ticks / BEAST_CLOCK_HZ
+
+        if (self.clock_offset==None or abs(offset - self.clock_offset) > self.clock_resync_s):
+            #First frame, or the receiver restarted or jumped
+            self.clock_offset = offset
+        elif (offset < self.clock_offset):
+            self.clock_offset = offset
+
+        return self.clock_offset + ticks / BEAST_CLOCK_HZ
+
+    def apply_frames(self, frames):
+        """ Update the aircraft dictionary from decoded (time, message)
+        frames. MUST be called holding the aircraft lock """
+
+        #Planes with a new position frame this batch
+        positioned = {}
+
+        for time, msg in frames:
+            icao_address = "{:06X}".format(int.from_bytes(msg[1:4], "big"))
+            me = int.from_bytes(msg[4:11], "big")
+            tc = me >> 51
+
+            plane = self.aircraft.get(icao_address)
+            if (plane==None):
+                plane = Aircraft()
+                plane.icao_address = icao_address
+                self.aircraft[icao_address] = plane
+
+            if (1 <= tc <= 4):
+                plane.callsign = self.decode_callsign(me)
+
+            elif (9 <= tc <= 18):
+                altitude = decode_altitude((me >> 36) & 0xFFF)
+                if (altitude!=None):
+                    plane.altitude = altitude
+
+                odd = (me >> 34) & 1
+                frame = ((me >> 17) & 0x1FFFF, me & 0x1FFFF, time)
+
+                cpr = self.cpr_frames.get(icao_address)
+                if (cpr==None):
+                    cpr = [None, None]
+                    self.cpr_frames[icao_address] = cpr
+
+                cpr[odd] = frame
+                positioned[icao_address] = odd
+
+            elif (tc == 19):
+                self.decode_velocity(plane, me)
+
+            self.changed_aircraft.add(icao_address)
+            self.expiry.touch(icao_address, time)
+
+        self.apply_positions(positioned)
+
+    def remove_aircraft(self, icao_address):
+        super().remove_aircraft(icao_address)
+
+        self.cpr_frames.pop(icao_address, None)
+
+    def apply_positions(self, positioned):
+        """ Globally decode the newest CPR pair of every plane in
+        positioned (icao -> parity of its newest frame) in one go """
+        icao_list = []
+        pairs = []
+
+        for icao_address, odd in positioned.items():
+            even_frame, odd_frame = self.cpr_frames[icao_address]
+
+            if (even_frame==None or odd_frame==None):
+                continue
+
+            if (abs(even_frame[2] - odd_frame[2]) > CPR_MAX_PAIR_AGE_S):
+                continue
+
+            icao_list.append(icao_address)
+            pairs.append((even_frame[0], even_frame[1], odd_frame[0], odd_frame[1], odd, odd_frame[2] if odd else even_frame[2]))
+
+        if (len(pairs)==0):
+            return
+
+        pairs = np.array(pairs, dtype=np.float64)
+        lat, lon, valid = cpr_decode_global(pairs[:, 0], pairs[:, 1], pairs[:, 2], pairs[:, 3], pairs[:, 4] > 0.5)
+
+        for i, icao_address in enumerate(icao_list):
+            if (not valid[i]):
+                continue
+
+            plane = self.aircraft[icao_address]
+
+            if (plane.altitude==None):
+                continue
+
+            plane.position = (float(lat[i]), float(lon[i]))
+            plane.last_pos_update = float(pairs[i, 5])
+            plane.last_vector_update = plane.last_pos_update
+
+    def decode_callsign(self, me):
+        callsign = ""
+        for i in range(8):
+            callsign += callsign_chars[(me >> (42 - 6*i)) & 0x3F]
+
+        return callsign.strip(" #")
+
+    def decode_velocity(self, plane, me):
+        """ Fill in ground speed (kts), track (deg) and vertical rate (ft/min)
+        from an airborne velocity message. Airspeed subtypes are ignored """
+        subtype = (me >> 48) & 0x7
+
+        if (subtype!=1 and subtype!=2):
+            return
+
+        v_ew = (me >> 32) & 0x3FF
+        v_ns = (me >> 21) & 0x3FF
+
+        if (v_ew!=0 and v_ns!=0):
+            #Supersonic subtype counts in 4kt steps
+            scale = 4.0 if subtype==2 else 1.0
+
+            v_east = (v_ew - 1) * scale
+            if ((me >> 42) & 1):
+                v_east = -v_east
+
+            v_north = (v_ns - 1) * scale
+            if ((me >> 31) & 1):
+                v_north = -v_north
+
+            plane.ground_speed = math.hypot(v_east, v_north)
+            plane.ground_heading = math.degrees(math.atan2(v_east, v_north)) % 360.0
+
+        vr = (me >> 10) & 0x1FF
+        if (vr!=0):
+            plane.vertical_speed = (vr - 1) * 64.0
+            if ((me >> 19) & 1):
+                plane.vertical_speed = -plane.vertical_speed
+
+
+async def loop():
+    while True:
+        await parser.message_loop()
+
+if __name__=="__main__":
+    parser = BeastParser("127.0.0.1", 30005)
+
+    asyncio.run(loop())
@@ -3,6 +3,7 @@ from ..aircraft.ADSBParser import ADSBParser
 from datetime import datetime
 import asyncio
 import re
+import time as t
 
 def to_float(st):
     if (len(st) > 0):
@@ -19,6 +20,12 @@ class Dump1090Parser(ADSBParser):
     sock_reader = None
     sock_writer = None
 
+    #Most bytes to take from the socket per message_loop call
+    read_size = 65536
+
+    #Incomplete line left over from the last read
+    partial_line = b""
+
     def __init__(self, addr, port):
         super().__init__()
 
@@ -26,7 +33,33 @@ class Dump1090Parser(ADSBParser):
         self.port = port
         self.poll_interval_ms = 0
 
+        self.changed_aircraft = set()
+
+        #Unix time of the start of each (date, hour) seen, so DST changes
+        #are still handled by datetime
+        self.hour_epochs = {}
+
     def decode_date_time(self, date_str, time_str):
+        """ Unix time of an SBS-1 date (YYYY/MM/DD) and time (HH:MM:SS.mmm) in
+        local time. The epoch of each hour is cached, so only the minutes and
+        seconds are parsed per message """
+        if (len(time_str)<8 or time_str[2]!=":" or time_str[5]!=":"):
+            return self.decode_date_time_slow(date_str, time_str)
+
+        key = (date_str, time_str[:2])
+        hour_epoch = self.hour_epochs.get(key)
+
+        if (hour_epoch==None):
+            hour_epoch = self.decode_date_time_slow(date_str, time_str[:2] + ":00:00.000")
+
+            if (len(self.hour_epochs) > 48):
+                self.hour_epochs.clear()
+
+            self.hour_epochs[key] = hour_epoch
+
+        return hour_epoch + int(time_str[3:5])*60 + float(time_str[6:])
+
+    def decode_date_time_slow(self, date_str, time_str):
         date_groups = timestamp_re.match(date_str + "T" + time_str).groups()
 
         year = int(date_groups[0])
@@ -42,74 +75,152 @@ class Dump1090Parser(ADSBParser):
         unix_time = date.timestamp()
 
         return unix_time
-        
 
     async def message_loop(self):
+        """ reads everything the socket has buffered, and applies all
+        of the complete SBS-1 lines in it at once """
         if (self.sock_reader==None or self.sock_writer==None):
             try:
                 self.sock_reader, self.sock_writer = await asyncio.open_connection(self.addr, self.port)
+                self.partial_line = b""
             except ConnectionRefusedError:
                 print("Dump1090 connection refused")
                 await asyncio.sleep(1)
                 return
 
-        line = (await self.sock_reader.readline()).decode("utf-8").replace("\r", "").replace("\n", "")
-        data = line.split(",")
+        data = await self.sock_reader.read(self.read_size)
+
+        if len(data)==0:
+            print("Dump1090 connection closed")
+            self.sock_writer.close()
+            self.sock_reader = None
+            self.sock_writer = None
+            return
+
+        messages = self.decode_lines(data)
 
-        if (data[0]!="MSG"):
+        if len(messages)==0:
             return
 
         async with self.aircraft_lock:
             if self.clear_aircraft_flag:
                 self.aircraft = {}
+                self.changed_aircraft = set()
+                self.expiry.clear()
                 self.clear_aircraft_flag = False
 
-            msg_type = data[1]
-            icao_address = data[4]
+            self.apply_messages(messages)
+            self.expire_aircraft(t.time())
+
+    def decode_lines(self, data):
+        """ Split a chunk of the SBS-1 stream into the fields of each
+        complete MSG line, keeping any partial line for the next chunk """
+        complete, _, self.partial_line = (self.partial_line + data).rpartition(b"\n")
+
+        messages = []
+        for line in complete.decode("ascii", "replace").split("\n"):
+            #Nothing after the vertical rate column is used
+            fields = line.split(",", 17)
+
+            if (fields[0]=="MSG" and len(fields) > 16):
+                messages.append(fields)
+
+        return messages
+
+    def apply_messages(self, messages):
+        """ MUST be called holding the aircraft lock """
+        receive_time = t.time()
+
+        for fields in messages:
+            try:
+                self.apply_message(fields)
+            except (ValueError, AttributeError):
+                print("Bad Dump1090 message: " + ",".join(fields))
+                continue
+
+            self.expiry.touch(fields[4], receive_time)
+
+    def apply_message(self, data):
+        """ Update the aircraft dictionary from one split SBS-1 message.
+        Fields are parsed before the plane is touched, so a malformed
+        message changes nothing. MUST be called holding the aircraft lock """
+        msg_type = data[1]
+        icao_address = data[4]
+
+        if (msg_type=="3"):
+            altitude = float(data[11])
+            position = (float(data[14]), float(data[15]))
+
+            #Only positions need the (comparatively slow) timestamp
             time = self.decode_date_time(data[6], data[7])
 
-            plane = self.aircraft.get(icao_address)
-            if (plane==None):
-                plane = Aircraft()
-                plane.icao_address = icao_address
+            plane = self.get_or_add_plane(icao_address)
+            plane.altitude = altitude
+            plane.position = position
+            plane.last_pos_update = time
+            plane.last_vector_update = time
 
-            if (msg_type=="4" or msg_type=="2"):
-                #Velocity data
-                gs = data[12]
-                trk = data[13]
+        elif (msg_type=="4"):
+            #Velocity data
+            ground_speed = float(data[12])
+            ground_heading = float(data[13])
 
-                plane.ground_speed = float(gs)
-                plane.ground_heading = float(trk)
+            vr = data[16]
+            vertical_speed = float(vr) if len(vr)>0 else None
 
-            if (msg_type=="4"):
-                vr = data[16]
+            plane = self.get_or_add_plane(icao_address)
+            plane.ground_speed = ground_speed
+            plane.ground_heading = ground_heading
 
-                if (len(vr)>0):
-                    plane.vertical_speed = float(vr)
+            if (vertical_speed!=None):
+                plane.vertical_speed = vertical_speed
 
-            if (msg_type=="2" or msg_type=="3"):
-                alt = data[11]
-                lat = data[14]
-                long = data[15]
+        elif (msg_type=="1"):
+            plane = self.get_or_add_plane(icao_address)
+            plane.callsign = data[10]
 
-                plane.altitude = float(alt)
-                plane.position = (float(lat), float(long))
-                plane.last_pos_update = time
-                plane.last_vector_update = time
+        elif (msg_type=="2"):
+            #Surface position, with velocity
+            ground_speed = float(data[12])
+            ground_heading = float(data[13])
+            altitude = float(data[11])
+            position = (float(data[14]), float(data[15]))
 
-            if (msg_type=="5" or msg_type=="6" or msg_type=="7"):
-                alt = data[11]
+            time = self.decode_date_time(data[6], data[7])
+
+            plane = self.get_or_add_plane(icao_address)
+            plane.ground_speed = ground_speed
+            plane.ground_heading = ground_heading
+            plane.altitude = altitude
+            plane.position = position
+            plane.last_pos_update = time
+            plane.last_vector_update = time
+
+        elif (msg_type=="5" or msg_type=="6" or msg_type=="7"):
+            alt = data[11]
+            altitude = float(alt) if len(alt) > 0 else None
+
+            plane = self.get_or_add_plane(icao_address)
 
-                if (len(alt) > 0):
-                    plane.altitude = float(alt)
-            
-            if (msg_type=="1"):
-                cs = data[10]
+            if (altitude!=None):
+                plane.altitude = altitude
 
-                plane.callsign = cs
+        else:
+            self.get_or_add_plane(icao_address)
 
+        self.changed_aircraft.add(icao_address)
+
+    def get_or_add_plane(self, icao_address):
+        """ MUST be called holding the aircraft lock """
+        plane = self.aircraft.get(icao_address)
+
+        if (plane==None):
+            plane = Aircraft()
+            plane.icao_address = icao_address
             self.aircraft[icao_address] = plane
 
+        return plane
+
 
 async def loop():
     while True:
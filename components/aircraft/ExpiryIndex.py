@@ -0,0 +1,60 @@
+""" Module to hold ExpiryIndex class """
+import heapq
+
+class ExpiryIndex:
+	""" Time ordered index of when each key was last seen, to find
+	the keys not seen since a cutoff without scanning all of them.
+	Each key keeps one heap entry, which is only refreshed with the
+	newer time when it reaches the top of the heap """
+
+	def __init__(self):
+		self.clear()
+
+	def __len__(self):
+		return len(self.last_seen)
+
+	def __contains__(self, key):
+		return key in self.last_seen
+
+	def clear(self):
+		#(time, key) entries, time being when the entry was pushed
+		self.heap = []
+
+		#Key to latest time seen
+		self.last_seen = {}
+
+	def touch(self, key, time):
+		""" Record key as seen at time """
+		last = self.last_seen.get(key)
+
+		if last==None:
+			heapq.heappush(self.heap, (time, key))
+			self.last_seen[key] = time
+		elif time > last:
+			self.last_seen[key] = time
+
+	def discard(self, key):
+		""" Forget key, its heap entry is dropped when it surfaces """
+		self.last_seen.pop(key, None)
+
+	def pop_expired(self, cutoff):
+		""" Remove and return the keys last seen before cutoff """
+		expired = []
+
+		while len(self.heap) > 0 and self.heap[0][0] < cutoff:
+			time, key = heapq.heappop(self.heap)
+			last = self.last_seen.get(key)
+
+			if last==None or last < time:
+				#Discarded, or superseded by a later entry
+				continue
+
+			if last > time:
+				#Seen since this entry was pushed, requeue it
+				heapq.heappush(self.heap, (last, key))
+				continue
+
+			del self.last_seen[key]
+			expired.append(key)
+
+		return expired
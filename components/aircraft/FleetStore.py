@@ -0,0 +1,378 @@
+""" Module to hold FleetStore class """
+from ..aircraft.Aircraft import Aircraft, arcmin, dtr
+import numpy as np
+
+#Per-aircraft numeric state, one array each. None is stored as NaN
+COLUMNS = (
+	"lat",
+	"long",
+	"altitude",
+	"ground_speed",
+	"ground_heading",
+	"vertical_speed",
+	"last_pos_update",
+	"last_vector_update"
+)
+
+def to_value(v):
+	""" NaN column value back to None """
+	return None if np.isnan(v) else float(v)
+
+def to_column(v):
+	""" None to NaN column value """
+	return np.nan if v is None else v
+
+def dead_reckon(lat, long, altitude, gs, heading, vs, dT):
+	""" Lat/Long/altitude after dT (s) at ground speed gs (kts), heading
+	(deg) and vertical speed vs (ft/min), as Aircraft.update. Works on
+	scalars or arrays """
+	heading = heading * dtr
+
+	dLat = gs * np.cos(heading) * arcmin * dT / 3600.0
+	dLong = gs * np.sin(heading) * arcmin * dT / 3600.0
+	dLong /= np.cos(lat*dtr)
+
+	new_Lat = lat + dLat
+	new_Long = long + dLong
+
+	#Over a pole, come back down the other side
+	over = np.abs(new_Lat) > 90.0
+	new_Lat = np.where(over, np.copysign(180.0, new_Lat) - new_Lat, new_Lat)
+	new_Long = np.where(over, new_Long + 180.0, new_Long)
+
+	new_Long = (new_Long + 180.0) % 360.0 - 180.0
+
+	return new_Lat, new_Long, altitude + vs * dT / 60.0
+
+class FleetView:
+	""" Read access to columnar aircraft state, shared by
+	FleetStore and FleetSnapshot """
+
+	def __len__(self):
+		return len(self.icao_list)
+
+	def __contains__(self, icao_address):
+		return icao_address in self.index
+
+	def predict(self, row, time):
+		""" Lat/Long/altitude of row dead reckoned to time, or None if
+		it can't be (no state vector, or stale) """
+		dT = time - self.last_vector_update[row]
+
+		if self.stale[row] or not dT > 0.0:
+			return None
+
+		state = (self.lat[row], self.long[row], self.altitude[row],
+			self.ground_speed[row], self.ground_heading[row], self.vertical_speed[row])
+
+		if np.any(np.isnan(state)):
+			return None
+
+		lat, long, altitude = dead_reckon(*state, dT)
+
+		return (float(lat), float(long), float(altitude))
+
+	def get(self, icao_address, time=None):
+		""" Get a new Aircraft holding the state of icao_address,
+		or None if it isn't in the store. If time is given, the
+		state is dead reckoned to it """
+		row = self.index.get(icao_address)
+
+		if row==None:
+			return None
+
+		plane = Aircraft()
+		plane.icao_address = icao_address
+		plane.callsign = self.callsigns[row]
+
+		lat = to_value(self.lat[row])
+		long = to_value(self.long[row])
+
+		if lat!=None and long!=None:
+			plane.position = (lat, long)
+
+		plane.altitude = to_value(self.altitude[row])
+		plane.ground_speed = to_value(self.ground_speed[row])
+		plane.ground_heading = to_value(self.ground_heading[row])
+		plane.vertical_speed = to_value(self.vertical_speed[row])
+		plane.last_pos_update = to_value(self.last_pos_update[row])
+		plane.last_vector_update = to_value(self.last_vector_update[row])
+
+		if time!=None:
+			predicted = self.predict(row, time)
+
+			if predicted!=None:
+				plane.position = predicted[:2]
+				plane.altitude = predicted[2]
+				plane.last_vector_update = time
+
+		return plane
+
+	def get_metric_pos(self, icao_address, time=None):
+		""" Lat/Long/metric height of icao_address, as
+		Aircraft.get_metric_pos, without building an Aircraft.
+		None if it isn't in the store or has no position. If time
+		is given, the position is dead reckoned to it """
+		row = self.index.get(icao_address)
+
+		if row==None:
+			return None
+
+		pos = None
+		if time!=None:
+			pos = self.predict(row, time)
+
+		if pos==None:
+			pos = (self.lat[row], self.long[row], self.altitude[row])
+
+		if np.isnan(self.last_pos_update[row]) or np.any(np.isnan(pos)):
+			return None
+
+		return (float(pos[0]), float(pos[1]), float(pos[2])*0.3048)
+
+	def is_stale(self, icao_address):
+		""" Whether icao_address hasn't been heard from recently
+		enough to keep propagating """
+		row = self.index.get(icao_address)
+
+		return row!=None and bool(self.stale[row])
+
+	def count_stale(self):
+		return int(np.count_nonzero(self.stale[:len(self.icao_list)]))
+
+	def get_all(self, time=None):
+		""" Dictionary of new Aircraft for the whole fleet """
+		return {icao_address: self.get(icao_address, time) for icao_address in self.icao_list}
+
+class FleetStore(FleetView):
+	""" Class to hold the state of every aircraft in columns,
+	so the whole fleet can be propagated in one vectorised step.
+	Rows are indexed by ICAO address """
+
+	#Row capacity to start with, doubled whenever it runs out
+	initial_capacity = 64
+
+	#Bumped whenever planes are added, removed or renamed
+	layout_version = 0
+
+	#Cached copy of the row layout for snapshots
+	layout_copy = None
+
+	def __init__(self):
+		self.clear()
+
+	def clear(self):
+		#ICAO address to row, and row to ICAO address
+		self.index = {}
+		self.icao_list = []
+
+		#Non-numeric state, by row
+		self.callsigns = []
+
+		self.size = 0
+		self.capacity = self.initial_capacity
+
+		for column in COLUMNS:
+			setattr(self, column, np.full(self.capacity, np.nan))
+
+		#Rows not to propagate until new data arrives
+		self.stale = np.zeros(self.capacity, dtype=bool)
+
+		self.layout_changed()
+
+	def grow(self):
+		new_capacity = self.capacity * 2
+
+		for column in COLUMNS:
+			arr = np.full(new_capacity, np.nan)
+			arr[:self.size] = getattr(self, column)[:self.size]
+			setattr(self, column, arr)
+
+		stale = np.zeros(new_capacity, dtype=bool)
+		stale[:self.size] = self.stale[:self.size]
+		self.stale = stale
+
+		self.capacity = new_capacity
+
+	def set(self, plane):
+		""" Insert or overwrite the row for plane """
+		row = self.index.get(plane.icao_address)
+
+		if row==None:
+			if self.size >= self.capacity:
+				self.grow()
+
+			row = self.size
+			self.size += 1
+
+			self.index[plane.icao_address] = row
+			self.icao_list.append(plane.icao_address)
+			self.callsigns.append(None)
+
+			self.layout_changed()
+
+		position = plane.position if plane.position!=None else (None, None)
+
+		self.lat[row] = to_column(position[0])
+		self.long[row] = to_column(position[1])
+		self.altitude[row] = to_column(plane.altitude)
+		self.ground_speed[row] = to_column(plane.ground_speed)
+		self.ground_heading[row] = to_column(plane.ground_heading)
+		self.vertical_speed[row] = to_column(plane.vertical_speed)
+		self.last_pos_update[row] = to_column(plane.last_pos_update)
+		self.last_vector_update[row] = to_column(plane.last_vector_update)
+
+		#New data, so it's live again
+		self.stale[row] = False
+
+		if self.callsigns[row]!=plane.callsign:
+			self.callsigns[row] = plane.callsign
+			self.layout_changed()
+
+	def remove(self, icao_address):
+		""" Remove a row, moving the last row into its place """
+		row = self.index.pop(icao_address, None)
+
+		if row==None:
+			return
+
+		last = self.size - 1
+
+		if row!=last:
+			last_icao = self.icao_list[last]
+
+			for column in COLUMNS:
+				arr = getattr(self, column)
+				arr[row] = arr[last]
+
+			self.stale[row] = self.stale[last]
+			self.icao_list[row] = last_icao
+			self.callsigns[row] = self.callsigns[last]
+			self.index[last_icao] = row
+
+		for column in COLUMNS:
+			getattr(self, column)[last] = np.nan
+
+		self.stale[last] = False
+		self.icao_list.pop()
+		self.callsigns.pop()
+		self.size = last
+
+		self.layout_changed()
+
+	def set_stale(self, icao_address):
+		""" Stop propagating a row until it is next set """
+		row = self.index.get(icao_address)
+
+		if row!=None:
+			self.stale[row] = True
+
+	def rows_of(self, icao_addresses):
+		""" Mask of the rows of icao_addresses, skipping any not in the store """
+		mask = np.zeros(self.size, dtype=bool)
+
+		for icao_address in icao_addresses:
+			row = self.index.get(icao_address)
+
+			if row!=None:
+				mask[row] = True
+
+		return mask
+
+	def layout_changed(self):
+		self.layout_version += 1
+		self.layout_copy = None
+
+	def snapshot(self, version, time):
+		""" Immutable FleetSnapshot of the current state """
+		n = self.size
+
+		#The row layout only needs copying when it has changed
+		if self.layout_copy==None:
+			self.layout_copy = (dict(self.index), tuple(self.icao_list), tuple(self.callsigns))
+
+		index, icao_list, callsigns = self.layout_copy
+
+		columns = {}
+		for column in COLUMNS:
+			arr = getattr(self, column)[:n].copy()
+			arr.flags.writeable = False
+			columns[column] = arr
+
+		columns["stale"] = self.stale[:n].copy()
+		columns["stale"].flags.writeable = False
+
+		return FleetSnapshot(version, self.layout_version, time, index, icao_list, callsigns, columns)
+
+	def merge(self, plane, time):
+		""" Merge new source data for a plane already in the store,
+		as Aircraft.merge """
+		existing = self.get(plane.icao_address)
+
+		existing.merge(plane, time)
+
+		self.set(existing)
+
+	def can_calc_update(self):
+		""" Mask of rows with enough state for a motion update,
+		as Aircraft.can_calc_update """
+		n = self.size
+
+		return ~(np.isnan(self.last_pos_update[:n])
+			| np.isnan(self.ground_speed[:n])
+			| np.isnan(self.ground_heading[:n])
+			| np.isnan(self.altitude[:n])
+			| np.isnan(self.vertical_speed[:n])
+			| np.isnan(self.lat[:n])
+			| np.isnan(self.last_vector_update[:n]))
+
+	def propagate(self, time, mask=None):
+		""" Propagate the state vectors of every row that can be
+		updated, isn't stale (and is in mask, if given) to time,
+		as Aircraft.update """
+		n = self.size
+
+		rows = self.can_calc_update() & ~self.stale[:n]
+
+		if mask is not None:
+			rows &= mask
+
+		if not np.any(rows):
+			return
+
+		dT = time - self.last_vector_update[:n][rows]
+
+		new_Lat, new_Long, new_Alt = dead_reckon(self.lat[:n][rows], self.long[:n][rows], self.altitude[:n][rows],
+			self.ground_speed[:n][rows], self.ground_heading[:n][rows], self.vertical_speed[:n][rows], dT)
+
+		self.lat[:n][rows] = new_Lat
+		self.long[:n][rows] = new_Long
+		self.altitude[:n][rows] = new_Alt
+		self.last_vector_update[:n][rows] = time
+
+
+class FleetSnapshot(FleetView):
+	""" Immutable copy of a FleetStore at one point in time.
+	Safe to read from any thread without locking """
+
+	def __init__(self, version, layout_version, time, index, icao_list, callsigns, columns):
+		#Bumped on every published change
+		self.version = version
+		#Layout version of the store when taken
+		self.layout_version = layout_version
+		#Time (s) the snapshot was taken
+		self.time = time
+
+		self.index = index
+		self.icao_list = icao_list
+		self.callsigns = callsigns
+
+		for column, arr in columns.items():
+			setattr(self, column, arr)
+
+	@staticmethod
+	def empty():
+		columns = {column: np.zeros(0) for column in COLUMNS}
+		columns["stale"] = np.zeros(0, dtype=bool)
+
+		return FleetSnapshot(0, 0, 0.0, {}, (), (), columns)
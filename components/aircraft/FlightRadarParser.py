@@ -16,6 +16,8 @@ class FlightRadarParser(ADSBParser):
         self.endpoint = endpoint
         self.poll_interval_ms = 1000  
 
+        self.changed_aircraft = set()
+
         self.query_lat = lat
         self.query_long = long
         self.bound_range = bound_range
@@ -85,6 +87,10 @@ class FlightRadarParser(ADSBParser):
                 self.aircraft = {}
                 self.clear_aircraft_flag = False
 
+            #The whole area is resent each poll, only pass on what moved
+            for icao_address, plane in data.items():
+                self.mark_changed(self.aircraft.get(icao_address), plane)
+
             self.aircraft = data
             # for icao_address, new_plane in data.items():
 
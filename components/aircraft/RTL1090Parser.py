@@ -21,6 +21,8 @@ class RTL1090Parser(ADSBParser):
 		self.addr = addr
 		self.poll_interval_ms = poll_interval_ms
 
+		self.changed_aircraft = set()
+
 	async def message_loop(self):
 		""" Queries RTL1090 table and returns an ICAO 24-bit indexed
 		list of Aircraft objects """
@@ -70,6 +72,11 @@ class RTL1090Parser(ADSBParser):
 				if (existing_plane!=None and self.clear_aircraft_flag==False):
 					if (existing_plane.position == plane.position):
 						plane.last_pos_update = existing_plane.last_pos_update
+				else:
+					existing_plane = None
+
+				#The table is resent in full, only pass on what moved
+				self.mark_changed(existing_plane, plane)
 
 				new_aircraft[plane.icao_address] = plane
 			
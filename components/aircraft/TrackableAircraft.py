@@ -10,25 +10,32 @@ class TrackableAircraft(Trackable):
 
     icao_address = None
 
+    #Whether we hold a subscription to the plane's updates
+    subscribed = False
+
     def __init__(self, aircraft_manager, icao_address):
         self.aircraft_manager = aircraft_manager
         self.icao_address = icao_address
 
-    def get_position(self):
-        plane = self.aircraft_manager.get_plane(self.icao_address)
+        #Have the manager keep our plane fresh while we track it
+        self.aircraft_manager.subscribe(self.icao_address)
+        self.subscribed = True
 
-        if plane==None:
-            return None
+    def get_position(self):
+        pos = self.aircraft_manager.get_plane_position(self.icao_address)
 
-        if plane.last_pos_update==None:
+        if pos==None:
             return None
 
-        pos = plane.get_metric_pos()
-
         return Position(Position.TYPE_LATLONG, lat=pos[0], long=pos[1], height=pos[2])
 
     def get_name(self):
         return self.icao_address
 
     def is_tracking(self):
-        return self.aircraft_manager.get_plane(self.icao_address)!=None
\ No newline at end of file
+        return self.aircraft_manager.has_plane(self.icao_address)
+
+    def release(self):
+        if self.subscribed:
+            self.aircraft_manager.unsubscribe(self.icao_address)
+            self.subscribed = False
\ No newline at end of file
@@ -1,7 +1,6 @@
 """ module containing the CalibrationManager class """
 
 from ..solver.CalibrationSolver import CalibrationSolver
-from ..solver.PointingSolver import PointingSolver
 from ..solver.MountModel import MountModel
 from ..tracking.Position import Position
 
@@ -19,6 +18,9 @@ class CalibrationPoint:
     #Point scope angle error
     reprojection_error = None
 
+    #Whether the solver rejected this point as an outlier
+    is_outlier = False
+
     #Trackable name
     object_name = None
 
@@ -66,28 +68,32 @@ class CalibrationManager:
 
         old_model = self.mount_model.copy()
 
-        params, result = self.calibration_solver.solve(self.mount_model, pos_arr, rots_arr)
+        params, result = self.calibration_solver.solve_least_squares(self.mount_model, pos_arr, rots_arr)
+
+        if result==None:
+            #Points were rejected by the solver, keep the previous model
+            self.mount_model = old_model
+            return -1.0
 
         print("Calibration result:")
-        print(result)
+        print(result.message)
+        print("Cost: " + str(result.cost) + " evaluations: " + str(result.nfev))
 
         if not result.success:
             self.mount_model = old_model
         else:
             self.mount_model.unpack_parameters(params)
 
-            #Calculate reprojection error
-            solver = PointingSolver(self.mount_model)
-
-            for cal_point in self.point_list:
-                scope_error = solver.scope_error(cal_point.motor_angles, cal_point.local_pos)
-
+            #Record reprojection error, and whether the point was rejected
+            for cal_point, scope_error, is_outlier in zip(self.point_list, result.point_errors, result.outliers):
                 cal_point.reprojection_error = scope_error
+                cal_point.is_outlier = bool(is_outlier)
 
         if update_tracker:
             self.object_tracker.set_mount_model(self.mount_model.copy())
 
-        return result.fun
+        #Average angular error (deg) of the points used in the fit
+        return np.mean(result.point_errors[~result.outliers])
 
     def send_model(self):
         self.object_tracker.set_mount_model(self.mount_model.copy())
@@ -0,0 +1,218 @@
+""" Module to send telescope commands from a worker thread """
+
+from collections import OrderedDict
+import threading
+import time
+
+class ScopeCommandChannel:
+	""" Wraps a telescope driver (eg. WebScope) so commands never block
+	the caller. Each kind of command has one slot, a newer command
+	replaces one not yet sent, and the worker thread sends them in the
+	order they were last set. The position is polled in between, and
+	get_altaz_deg returns the latest poll at once. Presents the same
+	interface as the driver """
+
+	#Seconds between position polls, None to only poll on demand
+	poll_interval_s = 0.2
+
+	#Reading a polled position older than this (s) asks the worker
+	#for a fresh poll
+	poll_max_age_s = 1.0
+
+	def __init__(self, driver, poll_interval_s=None):
+		self.driver = driver
+
+		if poll_interval_s!=None:
+			self.poll_interval_s = poll_interval_s
+
+		#Command name to (driver method, args), oldest first
+		self.slots = OrderedDict()
+		self.condition = threading.Condition()
+
+		#Latest polled (alt, az), the monotonic time (s) it was read,
+		#and when that read was started
+		self.polled_altaz = None
+		self.polled_time = None
+		self.polled_start_time = None
+		self.next_poll_time = 0.0
+		self.poll_requested = False
+
+		self.num_sent = 0
+		self.num_coalesced = 0
+		self.num_dropped = 0
+		self.num_polls = 0
+
+		self.running = True
+		self.worker = threading.Thread(target=self.worker_loop, daemon=True)
+		self.worker.start()
+
+	def submit(self, name, method, *args):
+		""" Queue a command, replacing any unsent one of the same name """
+		with self.condition:
+			if self.slots.pop(name, None)!=None:
+				self.num_coalesced += 1
+
+			self.slots[name] = (method, args)
+			self.condition.notify_all()
+
+	def worker_loop(self):
+		while True:
+			with self.condition:
+				while self.running and len(self.slots)==0 and not self.poll_due():
+					self.condition.wait(self.time_to_poll())
+
+				if not self.running:
+					return
+
+				#Polls take turns with commands, so a steady stream
+				#of commands can't starve them
+				command = None
+				if len(self.slots) > 0 and not self.poll_due():
+					command = self.slots.popitem(last=False)[1]
+
+			if command!=None:
+				self.send(*command)
+			else:
+				self.poll()
+
+	def poll_due(self):
+		if self.poll_requested:
+			return True
+
+		return self.poll_interval_s!=None and time.monotonic() >= self.next_poll_time
+
+	def time_to_poll(self):
+		if self.poll_requested:
+			return 0.0
+
+		if self.poll_interval_s==None:
+			return None
+
+		return max(0.0, self.next_poll_time - time.monotonic())
+
+	def send(self, method, args):
+		try:
+			ok = method(*args)
+		except Exception as e:
+			print("Telescope command failed: " + str(e))
+			ok = False
+
+		with self.condition:
+			if ok==False:
+				self.num_dropped += 1
+			else:
+				self.num_sent += 1
+
+	def poll(self):
+		with self.condition:
+			self.poll_requested = False
+
+			if self.poll_interval_s!=None:
+				self.next_poll_time = time.monotonic() + self.poll_interval_s
+
+		read_start = time.monotonic()
+
+		try:
+			altaz = self.driver.get_altaz_deg()
+		except Exception as e:
+			print("Telescope position poll failed: " + str(e))
+			return
+
+		with self.condition:
+			#The mount was read somewhere within the round trip, take the middle
+			self.polled_altaz = altaz
+			self.polled_time = 0.5 * (read_start + time.monotonic())
+			self.polled_start_time = read_start
+			self.num_polls += 1
+			self.condition.notify_all()
+
+	def request_poll(self):
+		""" Ask the worker to poll the position as soon as it can """
+		with self.condition:
+			self.poll_requested = True
+			self.condition.notify_all()
+
+	def close(self):
+		""" Stop the worker, unsent commands are discarded """
+		with self.condition:
+			self.running = False
+			self.condition.notify_all()
+
+		self.worker.join()
+
+	def slew_to_altaz_deg(self, alt, az):
+		self.submit("slewtoaltazasync", self.driver.slew_to_altaz_deg, alt, az)
+
+	def slew_rate_alt_deg(self, deg_per_sec):
+		self.submit("altrate", self.driver.slew_rate_alt_deg, deg_per_sec)
+
+	def slew_rate_az_deg(self, deg_per_sec):
+		self.submit("azrate", self.driver.slew_rate_az_deg, deg_per_sec)
+
+	def slew_rate_deg(self, alt_rate, az_rate):
+		self.submit("altazrate", self.driver.slew_rate_deg, alt_rate, az_rate)
+
+	def get_altaz_deg(self):
+		""" (alt, az) of the latest polled position, raises RuntimeError
+		if there hasn't been one yet. Use get_polled_altaz to also get
+		its age """
+		polled = self.get_polled_altaz()
+
+		if polled==None:
+			raise RuntimeError("No telescope position polled yet")
+
+		return polled[0], polled[1]
+
+	def wait_for_altaz(self, after_time, timeout_s):
+		""" (alt, az, monotonic time read) of the first poll started at or
+		after the monotonic time after_time, asking for one and waiting
+		up to timeout_s. Returns None on timeout """
+		deadline = time.monotonic() + timeout_s
+
+		with self.condition:
+			self.poll_requested = True
+			self.condition.notify_all()
+
+			while self.polled_start_time==None or self.polled_start_time < after_time:
+				remaining = deadline - time.monotonic()
+
+				if remaining <= 0.0 or not self.running:
+					return None
+
+				self.condition.wait(remaining)
+
+			return self.polled_altaz[0], self.polled_altaz[1], self.polled_time
+
+	def get_polled_altaz(self):
+		""" (alt, az, age in s) of the latest polled position, or None.
+		Never waits on the driver, a stale or missing position only
+		asks the worker to poll again """
+		with self.condition:
+			if self.polled_altaz==None:
+				polled = None
+			else:
+				polled = (self.polled_altaz[0], self.polled_altaz[1], time.monotonic() - self.polled_time)
+
+		if polled==None or polled[2] > self.poll_max_age_s:
+			self.request_poll()
+
+		return polled
+
+	def is_slewing(self):
+		return self.driver.is_slewing()
+
+	def get_latency_stats(self):
+		return self.driver.get_latency_stats()
+
+	def get_latency_s(self, name):
+		return self.driver.get_latency_s(name)
+
+	def get_stats(self):
+		with self.condition:
+			return {
+				"sent": self.num_sent,
+				"coalesced": self.num_coalesced,
+				"dropped": self.num_dropped,
+				"pending": len(self.slots),
+				"polls": self.num_polls
+			}
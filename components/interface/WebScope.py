@@ -2,22 +2,162 @@
 an ASCOM Alpaca telescope """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import threading
+import time
+
+def make_retry(total, backoff_factor, status_forcelist, methods):
+	""" urllib3 Retry that only retries read errors and status codes
+	for methods. Connection errors are retried for every method, as
+	the request never reached the server """
+	try:
+		return Retry(total=total, backoff_factor=backoff_factor,
+			status_forcelist=status_forcelist, allowed_methods=methods)
+	except TypeError:
+		#urllib3 before 1.26 names it method_whitelist
+		return Retry(total=total, backoff_factor=backoff_factor,
+			status_forcelist=status_forcelist, method_whitelist=methods)
+
+class LatencyStats:
+	""" Round trip times of the requests to one endpoint """
+
+	#Weight of the newest sample in the moving average
+	ewma_alpha = 0.2
+
+	def __init__(self):
+		self.count = 0
+		self.errors = 0
+		self.total_s = 0.0
+		self.max_s = 0.0
+		self.last_s = None
+		self.ewma_s = None
+
+	def add(self, latency_s):
+		self.count += 1
+		self.total_s += latency_s
+		self.max_s = max(self.max_s, latency_s)
+		self.last_s = latency_s
+
+		if self.ewma_s==None:
+			self.ewma_s = latency_s
+		else:
+			self.ewma_s += self.ewma_alpha * (latency_s - self.ewma_s)
+
+	def as_dict(self):
+		return {
+			"count": self.count,
+			"errors": self.errors,
+			"mean_ms": 1000.0 * self.total_s / self.count if self.count > 0 else None,
+			"max_ms": 1000.0 * self.max_s,
+			"last_ms": 1000.0 * self.last_s if self.last_s!=None else None,
+			"ewma_ms": 1000.0 * self.ewma_s if self.ewma_s!=None else None
+		}
 
 class WebScope:
 	""" Class to support communication with
 	an ASCOM Alpaca telescope"""
 
-	def __init__(self, endpoint, compliant = False):
+	#Seconds to wait to connect, and for a reply
+	connect_timeout_s = 1.0
+	read_timeout_s = 2.0
+
+	#Retries of failed connections and 5xx replies, with exponential backoff.
+	#Commands (PUT) are only retried if they failed to connect, so a
+	#slew that reached the mount is never replayed late
+	max_retries = 2
+	retry_backoff_s = 0.05
+
+	#Keep-alive connections to hold open to the driver
+	pool_size = 4
+
+	def __init__(self, endpoint, compliant = False, connect_timeout_s=None, read_timeout_s=None, max_retries=None):
 		self.prefix = endpoint
 		self.compliant = compliant
 
+		if connect_timeout_s!=None:
+			self.connect_timeout_s = connect_timeout_s
+		if read_timeout_s!=None:
+			self.read_timeout_s = read_timeout_s
+		if max_retries!=None:
+			self.max_retries = max_retries
+
+		#One pooled session, so commands reuse a kept-alive connection
+		#instead of opening a new one each
+		retry = make_retry(self.max_retries, self.retry_backoff_s, (502, 503, 504), frozenset(["GET"]))
+
+		adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+
+		self.session = requests.Session()
+		self.session.mount("http://", adapter)
+		self.session.mount("https://", adapter)
+
+		#Endpoint name to LatencyStats
+		self.latency_stats = {}
+		self.stats_lock = threading.Lock()
+
+	def request(self, method, name, data=None):
+		""" Make a request to endpoint name, recording its round trip time """
+		start = time.perf_counter()
+
+		try:
+			r = self.session.request(method, self.prefix + "/" + name, data=data,
+				timeout=(self.connect_timeout_s, self.read_timeout_s))
+		except requests.RequestException:
+			with self.stats_lock:
+				self.get_endpoint_stats(name).errors += 1
+			raise
+
+		latency = time.perf_counter() - start
+
+		with self.stats_lock:
+			self.get_endpoint_stats(name).add(latency)
+
+		return r
+
+	def command(self, name, data):
+		""" PUT a command, returning whether it was accepted. Failures
+		are reported rather than raised, the next command supersedes it """
+		try:
+			r = self.request("PUT", name, data)
+		except requests.RequestException as e:
+			print("Telescope command " + name + " failed: " + str(e))
+			return False
+
+		return r.ok
+
+	def get_endpoint_stats(self, name):
+		stats = self.latency_stats.get(name)
+
+		if stats==None:
+			stats = LatencyStats()
+			self.latency_stats[name] = stats
+
+		return stats
+
+	def get_latency_stats(self):
+		""" Dictionary of endpoint name to latency statistics """
+		with self.stats_lock:
+			return {name: stats.as_dict() for name, stats in self.latency_stats.items()}
+
+	def get_latency_s(self, name):
+		""" Moving average round trip time (s) of endpoint name, None
+		if it hasn't been used """
+		with self.stats_lock:
+			stats = self.latency_stats.get(name)
+
+			return stats.ewma_s if stats!=None else None
+
+	def close(self):
+		self.session.close()
+
 	def slew_to_altaz_deg(self, alt, az):
-		r = requests.put(self.prefix + "/slewtoaltazasync", data = {"Altitude": alt, "Azimuth": az})
+		return self.command("slewtoaltazasync", {"Altitude": alt, "Azimuth": az})
 
 	def get_altaz_deg(self):
 		if self.compliant:
-			r_alt = requests.get(self.prefix + "/altitude")
-			r_az = requests.get(self.prefix + "/azimuth")
+			r_alt = self.request("GET", "altitude")
+			r_az = self.request("GET", "azimuth")
 
 			alt = r_alt.json()["Value"]
 			az = r_az.json()["Value"]
@@ -25,22 +165,22 @@ class WebScope:
 			return alt, az
 
 		else:
-			r = requests.get(self.prefix + "/altaz")
+			r = self.request("GET", "altaz")
 
 			dic = r.json()
 			return dic["Altitude"], dic["Azimuth"]
 
 	def slew_rate_alt_deg(self, deg_per_sec):
-		r = requests.put(self.prefix + "/altrate", data = {"AltitudeRate": deg_per_sec})
+		return self.command("altrate", {"AltitudeRate": deg_per_sec})
 
 	def slew_rate_az_deg(self, deg_per_sec):
-		r = requests.put(self.prefix + "/azrate", data = {"AzimuthRate": deg_per_sec})
+		return self.command("azrate", {"AzimuthRate": deg_per_sec})
 
 	def slew_rate_deg(self, alt_rate, az_rate):
-		r = requests.put(self.prefix + "/altazrate", data = {"AltitudeRate": alt_rate, "AzimuthRate": az_rate})
+		return self.command("altazrate", {"AltitudeRate": alt_rate, "AzimuthRate": az_rate})
 
 	def is_slewing(self):
-		r = requests.get(self.prefix + "/slewing")
+		r = self.request("GET", "slewing")
 
 		return r.json()["Value"]
 
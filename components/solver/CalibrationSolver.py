@@ -4,7 +4,7 @@
 """
 
 import numpy as np
-from scipy.optimize import minimize
+from scipy.optimize import minimize, least_squares
 import math
 
 class CalibrationSolver:
@@ -13,6 +13,21 @@ class CalibrationSolver:
 	inputs
 	"""
 
+	#Robust loss used by solve_least_squares, "huber", "cauchy", "soft_l1" or "linear"
+	loss = "huber"
+
+	#Residual (deg) beyond which the robust loss down-weights a point
+	loss_scale_deg = 0.2
+
+	#Points further than this many robust sigmas from the model are outliers
+	outlier_sigma = 3.0
+
+	#Points closer than this (deg) are never outliers
+	outlier_min_deg = 0.5
+
+	#Fewest inlying points needed to refit without the outliers
+	min_refit_points = 4
+
 	def calc_average_offsets(self, pos_arr, rots_arr):
 		offset_Alt = 0.0
 		offset_Az = 0.0
@@ -37,55 +52,64 @@ class CalibrationSolver:
 
 		return offset_Alt, offset_Az
 
-	def solve(self, model, pos_arr, rots_arr, do_guess=True):
-		""" For an object at position pos, solves the 
-		MountModel to produce the pointing angles [Alt, Az]
-		"""
-
+	def check_arrays(self, pos_arr, rots_arr):
 		if pos_arr.shape[0] != rots_arr.shape[0]:
 			print("Position array length not the same as rotations array!")
-			return None, None
+			return False
 
 		if pos_arr.shape[1] != 3:
 			print("Position array has wrong element size: " + str(pos_arr.shape[0]))
-			return None, None
+			return False
 
 		if rots_arr.shape[1] != 2:
 			print("Rotations array has wrong element size: " + str(rots_arr.shape[0]))
-			return None, None
+			return False
 
-		if do_guess:
-			avg_offset_Alt, avg_offset_Az = self.calc_average_offsets(pos_arr, rots_arr)
+		return True
+
+	def guess_model(self, model, pos_arr, rots_arr):
+		avg_offset_Alt, avg_offset_Az = self.calc_average_offsets(pos_arr, rots_arr)
 
-			#Stage 1, azimuth plane orientation
-			model.az_rot_x = 0.0
-			model.az_rot_y = 0.0
+		#Stage 1, azimuth plane orientation
+		model.az_rot_x = 0.0
+		model.az_rot_y = 0.0
 
-			#Most of the yaw offset is likely to come from Azimuth
-			#drive offset
-			model.az_rot_z = avg_offset_Az
+		#Most of the yaw offset is likely to come from Azimuth
+		#drive offset
+		model.az_rot_z = avg_offset_Az
 
-			#Stage 3, declination roll
-			model.dec_roll = 0.0
+		#Stage 3, declination roll
+		model.dec_roll = 0.0
 
-			#Stage 4, declination home offset
-			#Likely to be most of the cause of altitude offset
-			model.dec_offset = avg_offset_Alt
+		#Stage 4, declination home offset
+		#Likely to be most of the cause of altitude offset
+		model.dec_offset = avg_offset_Alt
 
-			#Stage 6, scope yaw from dec axis
-			model.scope_yaw = 0.0
+		#Stage 6, scope yaw from dec axis
+		model.scope_yaw = 0.0
 
-			print("Guess: " + str(model))
+		print("Guess: " + str(model))
+
+	def solve(self, model, pos_arr, rots_arr, do_guess=True):
+		""" For an object at position pos, solves the 
+		MountModel to produce the pointing angles [Alt, Az]
+		"""
+
+		if not self.check_arrays(pos_arr, rots_arr):
+			return None, None
+
+		if do_guess:
+			self.guess_model(model, pos_arr, rots_arr)
 
 		model_params = model.pack_parameters()
 
 		print("Initial params: " + str(model_params))
 		
 
-		res = minimize(fun=CalibrationSolver.err_func,
+		res = minimize(fun=CalibrationSolver.err_func_grad,
 		         x0=model_params, 
 			     args=(model, pos_arr, rots_arr), 
-				 #jac=PointingSolver.diff_func,
+				 jac=True,
 				 #bounds=[(0, 90), (None, None)],
 
 				 method="L-BFGS-B",
@@ -103,27 +127,141 @@ class CalibrationSolver:
 
 			return res.x, res
 
+	def solve_least_squares(self, model, pos_arr, rots_arr, do_guess=True):
+		""" Solve the MountModel calibration parameters from
+		per-point angular residuals with a robust loss. Points
+		left with large errors are flagged as outliers, and the
+		model is refit without them.
+
+		The returned result also carries point_errors, the angle
+		(deg) between scope and object for each point, and outliers,
+		a boolean mask of the rejected points
+		"""
+
+		if not self.check_arrays(pos_arr, rots_arr):
+			return None, None
+
+		if do_guess:
+			self.guess_model(model, pos_arr, rots_arr)
+
+		model_params = model.pack_parameters()
+
+		print("Initial params: " + str(model_params))
+
+		res = self.run_least_squares(model, model_params, pos_arr, rots_arr)
+
+		point_errors = CalibrationSolver.point_errors(res.x, model, pos_arr, rots_arr)
+		outliers = self.find_outliers(point_errors)
+
+		num_inliers = np.count_nonzero(~outliers)
+
+		if np.any(outliers) and num_inliers >= self.min_refit_points:
+			print("Refitting without " + str(np.count_nonzero(outliers)) + " outliers")
+
+			res = self.run_least_squares(model, res.x, pos_arr[~outliers], rots_arr[~outliers])
+
+			point_errors = CalibrationSolver.point_errors(res.x, model, pos_arr, rots_arr)
+
+		res.point_errors = point_errors
+		res.outliers = outliers
+
+		if not res.success:
+			print("Calibration failed with message: ")
+			print(res.message)
+
+		return res.x, res
+
+	def run_least_squares(self, model, model_params, pos_arr, rots_arr):
+		return least_squares(fun=CalibrationSolver.residual_func,
+			x0=model_params,
+			jac=CalibrationSolver.residual_jac,
+			args=(model, pos_arr, rots_arr),
+			method="trf",
+			loss=self.loss,
+			f_scale=self.loss_scale_deg,
+			xtol=1e-12,
+			ftol=1e-12
+		)
+
+	def find_outliers(self, point_errors):
+		""" Flag points whose error is far outside the typical
+		spread, using the median as a robust sigma estimate """
+
+		#Errors are non-negative, so scale the median to a normal sigma
+		sigma = 1.4826 * np.median(point_errors)
+		threshold = max(self.outlier_sigma * sigma, self.outlier_min_deg)
+
+		return point_errors > threshold
+
+	@staticmethod
+	def residual_func(model_params, model, pos_arr, rots_arr):
+		""" Angular offsets (deg) of each object from the scope
+		axis, across (x) and up (z), as a (2N,) vector """
+		model.unpack_parameters(model_params)
+
+		scope_pos = model.transform_many(pos_arr, rots_arr)
+
+		res_x = np.arctan2(scope_pos[:, 0], scope_pos[:, 1])
+		res_z = np.arctan2(scope_pos[:, 2], scope_pos[:, 1])
+
+		return np.concatenate([res_x, res_z]) * 180.0 / np.pi
+
+	@staticmethod
+	def residual_jac(model_params, model, pos_arr, rots_arr):
+		""" (2N, 6) jacobian of residual_func """
+		model.unpack_parameters(model_params)
+
+		scope_pos, jac = model.transform_many_jacobian(pos_arr, rots_arr)
+
+		x = scope_pos[:, 0, np.newaxis]
+		y = scope_pos[:, 1, np.newaxis]
+		z = scope_pos[:, 2, np.newaxis]
+
+		#d atan2(a, b) = (b.da - a.db) / (a^2 + b^2)
+		jac_x = (y*jac[:, 0, :] - x*jac[:, 1, :]) / (x*x + y*y)
+		jac_z = (y*jac[:, 2, :] - z*jac[:, 1, :]) / (z*z + y*y)
+
+		return np.concatenate([jac_x, jac_z]) * 180.0 / np.pi
+
+	@staticmethod
+	def point_errors(model_params, model, pos_arr, rots_arr):
+		""" Angle (deg) between the scope axis and each object """
+		model.unpack_parameters(model_params)
+
+		scope_pos = model.transform_many(pos_arr, rots_arr)
+		v_len = np.linalg.norm(scope_pos, axis=1)
+
+		return np.arccos(np.clip(scope_pos[:, 1] / v_len, -1.0, 1.0)) * 180.0 / np.pi
+
 	@staticmethod
 	def err_func(model_params, model, pos_arr, rots_arr):
 		model.unpack_parameters(model_params)
 
-		num_items = pos_arr.shape[0]
-		err = 0.0
+		scope_pos = model.transform_many(pos_arr, rots_arr)
+
+		v_len = np.linalg.norm(scope_pos, axis=1)
 
-		#worst = 0.0
+		err = np.mean(1.0 - (scope_pos[:, 1] / v_len))
+
+		return err*10.0
+
+	@staticmethod
+	def err_func_grad(model_params, model, pos_arr, rots_arr):
+		""" err_func, along with its analytic gradient w.r.t the
+		packed model parameters """
+		model.unpack_parameters(model_params)
 
-		for i in range(num_items):
-			scope_pos = model.transform(pos_arr[i], rots_arr[i])
+		scope_pos, jac = model.transform_many_jacobian(pos_arr, rots_arr)
 
-			v_len = np.linalg.norm(scope_pos)
+		v_len = np.linalg.norm(scope_pos, axis=1)
+		cos_err = scope_pos[:, 1] / v_len
 
-			#ang = np.arccos(scope_pos[1]/v_len) * 180.0 / np.pi
-			#if ang>worst:
-			#	worst = ang
+		err = np.mean(1.0 - cos_err)
 
-			err += 1.0 - (scope_pos[1] / v_len)
+		#Derivative of y/|v| w.r.t the scope vector
+		d_cos = -scope_pos * (cos_err / (v_len*v_len))[:, np.newaxis]
+		d_cos[:, 1] += 1.0 / v_len
 
-		err /= num_items
-		#print("Worst: " + str(worst))
+		grad = -np.einsum("ni,nik->k", d_cos, jac) / pos_arr.shape[0]
 
-		return err*10.0
\ No newline at end of file
+		return err*10.0, grad*10.0
\ No newline at end of file
@@ -1,10 +1,88 @@
 """ Module implementing the model of the telescope mount """
 
-from scipy.spatial.transform import Rotation
 import json
+import math
 import numpy as np
 import logging
 
+dtr = math.pi / 180.0
+
+#Calibration parameters, in pack_parameters order
+PARAMETER_NAMES = ("az_rot_x", "az_rot_y", "az_rot_z", "dec_roll", "dec_offset", "scope_yaw")
+
+def rot_x(ang):
+	""" Rotation matrix of ang degrees about x """
+	c = math.cos(ang*dtr)
+	s = math.sin(ang*dtr)
+
+	return np.array([
+		[1.0, 0.0, 0.0],
+		[0.0, c, -s],
+		[0.0, s, c]
+	])
+
+def rot_y(ang):
+	""" Rotation matrix of ang degrees about y """
+	c = math.cos(ang*dtr)
+	s = math.sin(ang*dtr)
+
+	return np.array([
+		[c, 0.0, s],
+		[0.0, 1.0, 0.0],
+		[-s, 0.0, c]
+	])
+
+def rot_z(ang):
+	""" Rotation matrix of ang degrees about z """
+	c = math.cos(ang*dtr)
+	s = math.sin(ang*dtr)
+
+	return np.array([
+		[c, -s, 0.0],
+		[s, c, 0.0],
+		[0.0, 0.0, 1.0]
+	])
+
+def stack_rot_x(angs):
+	""" (N, 3, 3) rotation matrices about x, angs in radians """
+	c = np.cos(angs)
+	s = np.sin(angs)
+
+	M = np.zeros((len(angs), 3, 3))
+	M[:, 0, 0] = 1.0
+	M[:, 1, 1] = c
+	M[:, 1, 2] = -s
+	M[:, 2, 1] = s
+	M[:, 2, 2] = c
+
+	return M
+
+def stack_rot_z(angs):
+	""" (N, 3, 3) rotation matrices about z, angs in radians """
+	c = np.cos(angs)
+	s = np.sin(angs)
+
+	M = np.zeros((len(angs), 3, 3))
+	M[:, 0, 0] = c
+	M[:, 0, 1] = -s
+	M[:, 1, 0] = s
+	M[:, 1, 1] = c
+	M[:, 2, 2] = 1.0
+
+	return M
+
+def gen_x(v):
+	""" Rotation generator about x applied to (N, 3) vectors """
+	return np.stack([np.zeros(len(v)), -v[:, 2], v[:, 1]], axis=1)
+
+def gen_y(v):
+	""" Rotation generator about y applied to (N, 3) vectors """
+	return np.stack([v[:, 2], np.zeros(len(v)), -v[:, 0]], axis=1)
+
+def gen_z(v):
+	""" Rotation generator about z applied to (N, 3) vectors """
+	return np.stack([-v[:, 1], v[:, 0], np.zeros(len(v))], axis=1)
+
 class MountModel:
 	""" MountModel, retains calibration parameters, and methods
 	for transforming coordinates into scope space """
@@ -23,9 +101,34 @@ class MountModel:
 	#Stage 6, scope yaw from dec axis
 	scope_yaw = 0.0
 
+	#Cached parameter-only matrices, cleared whenever a parameter is set
+	param_matrices = None
+
 	def __init__(self):
 		self.load_default()
 
+	def __setattr__(self, name, value):
+		if name in PARAMETER_NAMES:
+			self.__dict__["param_matrices"] = None
+
+		super().__setattr__(name, value)
+
+	def get_parameter_matrices(self):
+		""" Get the precomposed matrices that depend only on the
+		calibration parameters (M1, M4.M3, M6) """
+
+		if self.param_matrices is None:
+			#Stage 1: Azimuth plane orientation matrix, extrinsic zxy
+			M1 = rot_y(self.az_rot_y).dot(rot_x(self.az_rot_x).dot(rot_z(self.az_rot_z)))
+			#Stage 3+4: Declination roll, then declination home
+			M43 = rot_x(-self.dec_offset).dot(rot_y(self.dec_roll))
+			#Stage 6: Scope yaw
+			M6 = rot_z(self.scope_yaw)
+
+			self.param_matrices = (M1, M43, M6)
+
+		return self.param_matrices
+
 	def load_default(self):
 		#Stage 1, azimuth plane orientation
 		self.az_rot_x = 0.0
@@ -58,21 +161,116 @@ class MountModel:
 			rots = [Alt, Az]
 		"""
 
-		#Stage 1: Azimuth plane orientation matrix
-		M1 = Rotation.from_euler("zxy", [self.az_rot_z, self.az_rot_x, self.az_rot_y], degrees=True).as_dcm()
+		M1, M43, M6 = self.get_parameter_matrices()
+
+		#Stage 1: Azimuth plane orientation
+		v = M1.dot(pos)
+
 		#Stage 2: Azimuth Rotation
-		M2 = Rotation.from_euler("z", rots[1], degrees=True).as_dcm()
-		#Stage 3: Declination roll
-		M3 = Rotation.from_euler("y", self.dec_roll, degrees=True).as_dcm()
-		#Stage 4+5: Declination Home + declination
-		M54 = Rotation.from_euler("x", -(self.dec_offset + rots[0]), degrees=True).as_dcm()
-		#Stage 6: Scope yaw
-		M6 = Rotation.from_euler("z", self.scope_yaw, degrees=True).as_dcm()
+		c = math.cos(rots[1]*dtr)
+		s = math.sin(rots[1]*dtr)
+		v = np.array([c*v[0] - s*v[1], s*v[0] + c*v[1], v[2]])
+
+		#Stage 3+4: Declination roll + declination home
+		v = M43.dot(v)
 
-		result = M6.dot(M54.dot(M3.dot(M2.dot(M1.dot(pos)))))
+		#Stage 5: Declination
+		c = math.cos(-rots[0]*dtr)
+		s = math.sin(-rots[0]*dtr)
+		v = np.array([v[0], c*v[1] - s*v[2], s*v[1] + c*v[2]])
+
+		#Stage 6: Scope yaw
+		result = M6.dot(v)
 
 		return result
 
+	def transform_many(self, pos_arr, rots_arr):
+		""" Batched transform, take object positions pos_arr, and
+		    Mount rotations rots_arr, and output scope relative
+			coordinates of each object
+
+			pos_arr = (N, 3) array of [x, y, z]
+			rots_arr = (N, 2) array of [Alt, Az]
+			returns (N, 3) array
+		"""
+
+		M1, M43, M6 = self.get_parameter_matrices()
+
+		pos_arr = np.asarray(pos_arr, dtype=float)
+		rots_arr = np.asarray(rots_arr, dtype=float)
+
+		#Stage 1: Azimuth plane orientation
+		v = np.matmul(pos_arr, M1.T)
+
+		#Stage 2: Azimuth Rotation, stacked per point
+		az = rots_arr[:, 1]*dtr
+		M2 = stack_rot_z(az)
+		v = np.einsum("nij,nj->ni", M2, v)
+
+		#Stage 3+4: Declination roll + declination home
+		v = np.matmul(v, M43.T)
+
+		#Stage 5: Declination, stacked per point
+		M5 = stack_rot_x(-rots_arr[:, 0]*dtr)
+		v = np.einsum("nij,nj->ni", M5, v)
+
+		#Stage 6: Scope yaw
+		return np.matmul(v, M6.T)
+
+	def transform_many_jacobian(self, pos_arr, rots_arr):
+		""" Batched transform, also returning the derivatives of
+		    the scope relative coordinates w.r.t the packed
+			parameters, per degree
+
+			pos_arr = (N, 3) array of [x, y, z]
+			rots_arr = (N, 2) array of [Alt, Az]
+			returns (N, 3) array, (N, 3, 6) jacobian
+		"""
+
+		pos_arr = np.asarray(pos_arr, dtype=float)
+		rots_arr = np.asarray(rots_arr, dtype=float)
+
+		Rz_z = rot_z(self.az_rot_z)
+		Rx_x = rot_x(self.az_rot_x)
+		Ry_y = rot_y(self.az_rot_y)
+		Ry_r = rot_y(self.dec_roll)
+		Rx_d = rot_x(-self.dec_offset)
+		M6 = rot_z(self.scope_yaw)
+
+		M2 = stack_rot_z(rots_arr[:, 1]*dtr)
+		M5 = stack_rot_x(-rots_arr[:, 0]*dtr)
+
+		#Object position after each stage of the chain
+		a1 = np.matmul(pos_arr, Rz_z.T)
+		a2 = np.matmul(a1, Rx_x.T)
+		a3 = np.matmul(a2, Ry_y.T)
+		a4 = np.einsum("nij,nj->ni", M2, a3)
+		a5 = np.matmul(a4, Ry_r.T)
+		a6 = np.matmul(a5, Rx_d.T)
+		a7 = np.einsum("nij,nj->ni", M5, a6)
+		scope_pos = np.matmul(a7, M6.T)
+
+		#Remainder of the chain following each stage
+		T6 = np.matmul(M6, M5)
+		T5 = np.matmul(T6, Rx_d)
+		T3 = np.matmul(np.matmul(T5, Ry_r), M2)
+		T2 = np.matmul(T3, Ry_y)
+		T1 = np.matmul(T2, Rx_x)
+
+		#d/dang R(ang).v = K.R(ang).v, so each derivative is the
+		#remaining chain applied to the generator of that stage
+		jac = np.empty((pos_arr.shape[0], 3, 6))
+		jac[:, :, 0] = np.einsum("nij,nj->ni", T2, gen_x(a2))
+		jac[:, :, 1] = np.einsum("nij,nj->ni", T3, gen_y(a3))
+		jac[:, :, 2] = np.einsum("nij,nj->ni", T1, gen_z(a1))
+		jac[:, :, 3] = np.einsum("nij,nj->ni", T5, gen_y(a5))
+		jac[:, :, 4] = -np.einsum("nij,nj->ni", T6, gen_x(a6))
+		jac[:, :, 5] = gen_z(scope_pos)
+
+		jac *= dtr
+
+		return scope_pos, jac
+
 	def pack_parameters(self):
 		return np.array([
 			self.az_rot_x,
@@ -4,37 +4,222 @@
 """
 
 import numpy as np
-from scipy.optimize import minimize
+from scipy.optimize import minimize, OptimizeResult
 import math
 
+dtr = math.pi / 180.0
+
+#Below this the mount geometry is treated as singular
+degenerate_eps = 1e-9
+
+def wrap_angle(ang):
+	""" Wrap an angle in degrees into [-180, 180) """
+	return (ang + 180.0) % 360.0 - 180.0
+
 class PointingSolver:
 	""" Class to calculate pointing angles given a target
 	point and a calibrated MountModel
 	"""
 
+	#Batch solutions within this scope error (deg) count as reachable
+	reachable_tolerance_deg = 1e-3
+
 	def __init__(self, model):
 		self.model = model
 
 	def set_model(self, model):
 		self.model = model
 
+	def naive_guess(self, pos):
+		""" Guess where point would be if there were no alignment errors """
+		base_length = np.sqrt(pos[0]*pos[0] + pos[1]*pos[1])
+
+		#Calculate local alt/az of point, including the stepper home
+		#positions
+		true_Alt = np.arctan2(pos[2], base_length)*180.0 / np.pi - self.model.dec_offset
+		true_Az = -np.arctan2(pos[1], pos[0])*180.0 / np.pi - self.model.az_rot_z + 90.0
+
+		return np.array([true_Alt, true_Az])
+
 	def solve(self, pos, guess = None):
 		""" For an object at position pos, solves the 
 		MountModel to produce the pointing angles [Alt, Az]
+
+		The mount chain is inverted analytically, the guess picks
+		between the two solution branches. The minimiser is only
+		used when the geometry is degenerate or unreachable
+		"""
+
+		if guess is None:
+			guess = self.naive_guess(pos)
+
+		rots = self.solve_analytic(pos, guess)
+
+		if rots is None:
+			return self.solve_numeric(pos, guess)
+
+		res = OptimizeResult(
+			x=rots,
+			fun=PointingSolver.err_func(rots, self.model, pos),
+			success=True,
+			status=0,
+			nit=0,
+			nfev=1,
+			message="Analytic solution"
+		)
+
+		scope_error = self.scope_error(rots, pos)
+		result_angles = np.mod(rots, 360.0)
+
+		return result_angles, res, scope_error
+
+	def solve_analytic(self, pos, guess):
+		""" Directly invert the MountModel chain for [Alt, Az]. Returns
+		the branch closest to guess, or None if the geometry is degenerate
+		"""
+
+		model = self.model
+
+		#Stage 1: Object position in the azimuth plane
+		M1 = model.get_parameter_matrices()[0]
+		q = M1.dot(pos)
+
+		q_len = math.sqrt(q[0]*q[0] + q[1]*q[1] + q[2]*q[2])
+		q_base = math.sqrt(q[0]*q[0] + q[1]*q[1])
+
+		#Object on the azimuth axis, Az is undefined
+		if q_len < degenerate_eps or q_base < degenerate_eps*q_len:
+			return None
+
+		q_z = q[2] / q_len
+
+		sin_r = math.sin(model.dec_roll*dtr)
+		cos_r = math.cos(model.dec_roll*dtr)
+
+		#Scope boresight ahead of the scope yaw (M6^T . [0, 1, 0])
+		t_x = math.sin(model.scope_yaw*dtr)
+		t_y = math.cos(model.scope_yaw*dtr)
+
+		#Azimuth rotation preserves z, so the declination angle must
+		#bring the boresight to the same height as the object
+		denom = cos_r*t_y
+
+		if abs(denom) < degenerate_eps:
+			return None
+
+		sin_dec = (q_z - sin_r*t_x) / denom
+
+		if abs(sin_dec) > 1.0:
+			#Outside the reachable cone, let the minimiser find the closest point
+			if abs(sin_dec) > 1.0 + degenerate_eps:
+				return None
+
+			sin_dec = math.copysign(1.0, sin_dec)
+
+		q_ang = math.atan2(q[1], q[0])
+
+		best_rots = None
+		best_dist = None
+
+		dec_a = math.asin(sin_dec)
+
+		for dec in (dec_a, math.pi - dec_a):
+			cos_dec = math.cos(dec)
+
+			#Boresight rotated back through the declination roll and angle
+			w_x = cos_r*t_x - sin_r*sin_dec*t_y
+			w_y = cos_dec*t_y
+
+			alt = dec/dtr - model.dec_offset
+			az = (math.atan2(w_y, w_x) - q_ang)/dtr
+
+			#Take the equivalent angles closest to the guess
+			alt = guess[0] + wrap_angle(alt - guess[0])
+			az = guess[1] + wrap_angle(az - guess[1])
+
+			dist = (alt - guess[0])**2 + (az - guess[1])**2
+
+			if best_dist is None or dist < best_dist:
+				best_rots = np.array([alt, az])
+				best_dist = dist
+
+		return best_rots
+
+	def naive_guess_many(self, pos_arr):
+		""" Batched naive_guess, (N, 3) positions to (N, 2) [Alt, Az] """
+		pos_arr = np.asarray(pos_arr, dtype=float)
+
+		base_length = np.sqrt(pos_arr[:, 0]*pos_arr[:, 0] + pos_arr[:, 1]*pos_arr[:, 1])
+
+		true_Alt = np.arctan2(pos_arr[:, 2], base_length)*180.0 / np.pi - self.model.dec_offset
+		true_Az = -np.arctan2(pos_arr[:, 1], pos_arr[:, 0])*180.0 / np.pi - self.model.az_rot_z + 90.0
+
+		return np.stack([true_Alt, true_Az], axis=1)
+
+	def solve_analytic_many(self, pos_arr, guess_arr):
+		""" Batched solve_analytic. Returns (N, 2) [Alt, Az] on the
+		branches closest to guess_arr, and an (N,) mask of which points
+		had a non-degenerate solution. The declination is clipped to the
+		reachable cone for the rest, giving the nearest pointing
 		"""
 
-		#Guess where point would be if there were no alignment errors
-		if guess==None:
-			base_length = np.sqrt(pos[0]*pos[0] + pos[1]*pos[1])
+		model = self.model
+		pos_arr = np.asarray(pos_arr, dtype=float)
+		guess_arr = np.asarray(guess_arr, dtype=float)
+
+		#Stage 1: Object positions in the azimuth plane
+		M1 = model.get_parameter_matrices()[0]
+		q = np.matmul(pos_arr, M1.T)
+
+		q_len = np.linalg.norm(q, axis=1)
+		q_base = np.sqrt(q[:, 0]*q[:, 0] + q[:, 1]*q[:, 1])
+
+		valid = (q_len >= degenerate_eps) & (q_base >= degenerate_eps*q_len)
+
+		q_z = q[:, 2] / np.where(valid, q_len, 1.0)
+
+		sin_r = math.sin(model.dec_roll*dtr)
+		cos_r = math.cos(model.dec_roll*dtr)
+
+		t_x = math.sin(model.scope_yaw*dtr)
+		t_y = math.cos(model.scope_yaw*dtr)
+
+		denom = cos_r*t_y
+
+		if abs(denom) < degenerate_eps:
+			return np.array(guess_arr), np.zeros(pos_arr.shape[0], dtype=bool)
+
+		sin_dec = (q_z - sin_r*t_x) / denom
+
+		valid &= np.abs(sin_dec) <= 1.0 + degenerate_eps
+		sin_dec = np.clip(sin_dec, -1.0, 1.0)
+
+		q_ang = np.arctan2(q[:, 1], q[:, 0])
+
+		dec_a = np.arcsin(sin_dec)
+		decs = np.stack([dec_a, np.pi - dec_a], axis=1)
+
+		w_x = cos_r*t_x - sin_r*sin_dec*t_y
+		w_y = np.cos(decs)*t_y
+
+		alts = decs/dtr - model.dec_offset
+		azs = (np.arctan2(w_y, w_x[:, np.newaxis]) - q_ang[:, np.newaxis])/dtr
+
+		#Take the equivalent angles closest to the guess
+		alts = guess_arr[:, 0, np.newaxis] + wrap_angle(alts - guess_arr[:, 0, np.newaxis])
+		azs = guess_arr[:, 1, np.newaxis] + wrap_angle(azs - guess_arr[:, 1, np.newaxis])
+
+		dist = (alts - guess_arr[:, 0, np.newaxis])**2 + (azs - guess_arr[:, 1, np.newaxis])**2
+		branch = np.argmin(dist, axis=1)
 
-			#Calculate local alt/az of point, including the stepper home
-			#positions
-			true_Alt = np.arctan(pos[2]/base_length)*180.0 / np.pi - self.model.dec_offset
-			true_Az = -np.arctan2(pos[1], pos[0])*180.0 / np.pi - self.model.az_rot_z + 90.0
+		idx = np.arange(pos_arr.shape[0])
+		rots_arr = np.stack([alts[idx, branch], azs[idx, branch]], axis=1)
 
-			guess = np.array([true_Alt, true_Az])
+		return rots_arr, valid
 
-			#print("Guess is " + str(guess))
+	def solve_numeric(self, pos, guess):
+		""" Solve for [Alt, Az] by minimising the pointing error
+		from the starting guess """
 
 		res = minimize(fun=PointingSolver.err_func,
 		         x0=guess, 
@@ -62,8 +247,43 @@ class PointingSolver:
 
 			return result_angles, res, scope_error
 
-	def get_point_altaz(self, pos):
-		result_angles, res, scope_error = self.solve(pos)
+	def solve_many(self, pos_arr, from_angles = None):
+		""" Solve [Alt, Az] for many objects at once.
+
+			pos_arr = (N, 3) array of [x, y, z]
+			from_angles = optional current [Alt, Az], picks the
+				branch needing the least slew for each object
+
+			returns (N, 2) angles in [0, 360), (N,) scope error (deg)
+			and an (N,) mask of objects the mount can point at
+		"""
+
+		pos_arr = np.asarray(pos_arr, dtype=float)
+
+		if from_angles is None:
+			guess_arr = self.naive_guess_many(pos_arr)
+		else:
+			guess_arr = np.broadcast_to(np.asarray(from_angles, dtype=float), (pos_arr.shape[0], 2))
+
+		rots_arr, valid = self.solve_analytic_many(pos_arr, guess_arr)
+
+		scope_errors = self.scope_errors(rots_arr, pos_arr)
+		reachable = scope_errors <= self.reachable_tolerance_deg
+
+		return np.mod(rots_arr, 360.0), scope_errors, reachable
+
+	@staticmethod
+	def slew_costs(rots_arr, from_angles):
+		""" Slew cost (deg) from from_angles [Alt, Az] to each of the
+		(N, 2) rots_arr. Both axes drive together, so the cost is
+		the larger of the two axis moves """
+
+		delta = wrap_angle(np.asarray(rots_arr, dtype=float) - np.asarray(from_angles, dtype=float))
+
+		return np.max(np.abs(delta), axis=1)
+
+	def get_point_altaz(self, pos, guess = None):
+		result_angles, res, scope_error = self.solve(pos, guess)
 
 		return result_angles[0], result_angles[1]
 
@@ -88,6 +308,14 @@ class PointingSolver:
 
 		return np.arccos(scope_pos[1]/v_len) * 180.0 / np.pi
 
+	def scope_errors(self, rots_arr, pos_arr):
+		""" Batched scope_error, (N, 2) rotations and (N, 3) positions """
+		scope_pos = self.model.transform_many(pos_arr, rots_arr)
+
+		v_len = np.linalg.norm(scope_pos, axis=1)
+
+		return np.arccos(np.clip(scope_pos[:, 1]/v_len, -1.0, 1.0)) * 180.0 / np.pi
+
 	def plot_error_surf(self, pos):
 		import matplotlib.pyplot as plt
 		from matplotlib import cm
@@ -96,18 +324,14 @@ class PointingSolver:
 		az = np.linspace(-180.0, 180.0, 60)
 
 		alts, azs = np.meshgrid(alt, az)
-		errs = np.zeros(alts.shape)
-
-		for i in range(alts.shape[0]):
-			for j in range(alts.shape[1]):
-				errs[i][j] = np.clip(np.power(PointingSolver.err_func(np.array([alts[i][j], azs[i][j]]), self.model, pos), 0.3), 0, 0.6)
+		rots_arr = np.stack([alts.ravel(), azs.ravel()], axis=1)
+		pos_arr = np.broadcast_to(pos, (rots_arr.shape[0], 3))
 
-		base_length = np.sqrt(pos[0]*pos[0] + pos[1]*pos[1])
-
-		true_Alt = np.arctan(pos[2]/base_length)*180.0 / np.pi - self.model.dec_offset
-		true_Az = -np.arctan2(pos[1], pos[0])*180.0 / np.pi - self.model.az_rot_z + 90.0
+		scope_pos = self.model.transform_many(pos_arr, rots_arr)
+		errs = (1.0 - scope_pos[:, 1] / np.linalg.norm(scope_pos, axis=1))*10.0
+		errs = np.clip(np.power(errs, 0.3), 0, 0.6).reshape(alts.shape)
 
-		guess = np.array([true_Alt, true_Az])
+		guess = self.naive_guess(pos)
 		guess_err = PointingSolver.err_func(guess, self.model, pos)
 
 		res, result, scope_error = self.solve(pos)
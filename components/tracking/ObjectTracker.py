@@ -4,10 +4,15 @@ from ..solver.MountModel import MountModel
 from ..solver.PointingSolver import PointingSolver
 from ..tracking.Trackable import Trackable
 from ..tracking.Position import Position
+from ..tracking.SolverState import SolverState
+from ..tracking.RateController import RateController
 
 from collections import namedtuple
 
 import logging
+import math
+import threading
+import time
 
 class ObjectTracker:
     """ Class to manage the real-time tracking of some 
@@ -34,25 +39,152 @@ class ObjectTracker:
     #The most recent motor angle command
     last_motor_angle = (0.0, 0.0)
 
+    #The most recent pointing solution in model space, before the
+    #tracking offset and alt>90 flip are applied to it
+    last_model_angle = (0.0, 0.0)
+
+    #Pointing solution history for the tracked object
+    solver_state = None
+
+    #Drive the mount with a position slew every tick, or with
+    #continuous Alt/Az rates corrected by a RateController
+    MODE_POSITION = "position"
+    MODE_RATE = "rate"
+    tracking_mode = MODE_POSITION
+
+    #Rate mode feedback controller
+    rate_controller = None
+
+    #Whether to lead the target by the measured pipeline latency
+    lead_enabled = True
+
+    #Time (s) the mount takes to respond to a command, on top of the
+    #measured solve and command latency
+    mount_lag_s = 0.1
+
+    #Never lead by more than this (s)
+    max_lead_s = 2.0
+
+    #Moving average (s) of the time from reading the target position
+    #to having the mount command ready to send
+    solve_latency_s = 0.0
+
+    #Weight of the newest sample in the solve latency average
+    latency_smoothing = 0.2
+
+    #Longest (s) get_state waits for a fresh mount reading
+    capture_timeout_s = 2.0
+
+    #The lead applied on the most recent tick
+    LeadState = namedtuple("LeadState", "latency_s alt az")
+    last_lead = LeadState(0.0, 0.0, 0.0)
+
+    #Re-entrant lock held by run, and by anything changing what or how
+    #we track, as run is called from the TrackingEngine thread. Only
+    #held to compute commands, never while talking to the driver
+    lock = None
+
+    #Held from computing driver commands until they are sent, so they
+    #reach the driver in the order they were decided. Always taken
+    #before lock, never inside it
+    send_lock = None
+
     def __init__(self, local_coordinate_transformer, scope_driver, mount_model=MountModel()):
         self.local_coordinate_transformer = local_coordinate_transformer
         self.scope_driver = scope_driver
 
         self.mount_model = mount_model
         self.pointing_solver = PointingSolver(mount_model)
+        self.solver_state = SolverState()
+        self.rate_controller = RateController()
+        self.lock = threading.RLock()
+        self.send_lock = threading.Lock()
 
     def set_tracked_object(self, obj):
-        self.tracked_object = obj
+        with self.send_lock:
+            with self.lock:
+                old_obj = self.tracked_object
+
+                self.tracked_object = obj
+                self.solver_state.reset()
+                commands = self.stop_rates()
+
+            self.send_commands(commands)
+
+        if old_obj!=None and old_obj is not obj:
+            old_obj.release()
+
+    def set_tracking_mode(self, mode):
+        if mode!=self.MODE_POSITION and mode!=self.MODE_RATE:
+            raise ValueError("Unknown tracking mode: " + str(mode))
+
+        commands = []
+
+        with self.send_lock:
+            with self.lock:
+                if mode!=self.tracking_mode:
+                    commands = self.stop_rates()
+                    self.tracking_mode = mode
+
+            self.send_commands(commands)
+
+    def get_tracking_mode(self):
+        return self.tracking_mode
+
+    def get_pipeline_latency(self, endpoint):
+        """ expected time (s) from reading the target position to the mount
+        moving: solve time, half the command round trip and the mount lag """
+        latency = self.solve_latency_s + self.mount_lag_s
+
+        #Drivers that don't measure their round trip count as instant
+        get_latency_s = getattr(self.scope_driver, "get_latency_s", None)
+
+        if get_latency_s!=None:
+            rtt = get_latency_s(endpoint)
+
+            if rtt!=None:
+                latency += rtt / 2.0
+
+        return min(latency, self.max_lead_s)
+
+    def get_lead(self):
+        """ the lead applied on the last tick, as a LeadState of the
+        latency (s) led by and the [Alt, Az] offset (deg) it gave """
+        return self.last_lead
+
+    def stop_rates(self):
+        """ get the commands to bring the mount to a halt if it was left
+        moving at a rate, MUST be called holding the lock """
+        commands = []
+
+        if self.rate_controller.is_moving():
+            commands.append((self.scope_driver.slew_rate_deg, (0.0, 0.0)))
+
+        self.rate_controller.reset()
+
+        return commands
+
+    def send_commands(self, commands):
+        """ send a list of (driver method, args) commands, MUST be called
+        holding send_lock but not lock, as the driver may block """
+        for method, args in commands:
+            method(*args)
 
     def set_mount_model(self, mount_model):
-        self.mount_model = mount_model.copy()
-        self.pointing_solver.set_model(self.mount_model)
+        with self.lock:
+            self.mount_model = mount_model.copy()
+            self.pointing_solver.set_model(self.mount_model)
+
+            #Old solutions don't apply to the new model
+            self.solver_state.reset()
 
     def set_tracking_offset(self, alt, az):
-        self.tracking_offset = (alt, az)
+        with self.lock:
+            self.tracking_offset = (alt, az)
 
     def add_tracking_offset(self, dAlt, dAz):
-        self.tracking_offset = (self.tracking_offset[0] + dAlt, self.tracking_offset[1] + dAz)
+        with self.lock:
+            self.tracking_offset = (self.tracking_offset[0] + dAlt, self.tracking_offset[1] + dAz)
 
     def get_tracking_offset(self):
         return self.tracking_offset
@@ -89,6 +221,18 @@ class ObjectTracker:
 
         return obj_pos
 
+    def rank_positions(self, pos_arr):
+        """ solve an (N, 3) array of epsg:4979 Lat/Long/h positions at once.
+        Returns the [Alt, Az] angles, the slew cost (deg) from the last motor
+        angle, and whether the mount can point at each one """
+        local_arr = self.local_coordinate_transformer.transform_many(pos_arr)
+
+        with self.lock:
+            rots_arr, scope_errors, reachable = self.pointing_solver.solve_many(local_arr, self.last_model_angle)
+            costs = PointingSolver.slew_costs(rots_arr, self.last_model_angle)
+
+        return rots_arr, costs, reachable
+
     def get_tracked_object(self):
         return self.tracked_object
 
@@ -98,27 +242,75 @@ class ObjectTracker:
     def run(self):
         """ calculate a new state vector and send to
         scope driver """
+        #Driver reads and commands happen outside the lock, so the
+        #GUI is never held up waiting on the mount. The send lock keeps
+        #the mode, and the order commands are sent in, from changing
+        with self.send_lock:
+            with self.lock:
+                mode = self.tracking_mode
+
+            mount_angles = self.get_mount_angles() if mode==self.MODE_RATE else None
+
+            with self.lock:
+                commands = self.run_tick(mount_angles)
+
+            self.send_commands(commands)
+
+    def run_tick(self, mount_angles=None):
+        """ one tracking update from the mount position mount_angles (see
+        get_mount_angles), returns the driver commands to send. MUST be
+        called holding the lock """
+        tick_start = time.perf_counter()
 
         #Get cartesian coordinates of object
         local_pos = self.get_trackable_position()
         
         if local_pos==None:
-            return
+            #Don't leave the mount running after a lost target
+            return self.stop_rates()
 
         alt = None
         az = None
 
         if (local_pos.pos_type == Position.TYPE_CARTESIAN):
-            #Get unmodified AltAz
-            alt, az = self.pointing_solver.get_point_altaz(local_pos.as_tuple())
+            #Get unmodified AltAz, starting from where the last
+            #solution is expected to have moved to
+            solve_time = time.time()
+            guess = self.solver_state.predict(solve_time)
+
+            result_angles, res, scope_error = self.pointing_solver.solve(local_pos.as_tuple(), guess)
+            self.solver_state.update(res.x, solve_time, res.nit)
+
+            alt, az = result_angles
         else:
             raise RuntimeError("Unusable local position type")
 
+        #Lead the target by where it will have moved to once the
+        #mount acts on this command
+        lead_time = 0.0
+        lead = (0.0, 0.0)
+
+        if self.lead_enabled and self.solver_state.num_solves > 1:
+            endpoint = "altazrate" if self.tracking_mode==self.MODE_RATE else "slewtoaltazasync"
+            lead_time = self.get_pipeline_latency(endpoint)
+
+            rate = self.solver_state.rate
+            acceleration = self.solver_state.acceleration
+            lead = tuple(rate[i]*lead_time + 0.5*acceleration[i]*lead_time*lead_time for i in range(2))
+
+            alt += lead[0]
+            az += lead[1]
+
+        self.last_lead = self.LeadState(lead_time, lead[0], lead[1])
+        self.last_model_angle = (alt, az)
+
         #Add modifiers
         alt += self.tracking_offset[0]
         az += self.tracking_offset[1]
 
-        if (abs(alt) > 90.0):
+        flipped = abs(alt) > 90.0
+
+        if flipped:
             az += 180.0
 
             if alt > 0.0:
@@ -128,25 +320,179 @@ class ObjectTracker:
 
         az = az % 360.0
 
-        #Drive scope
-        self.scope_driver.slew_to_altaz_deg(alt, az)
+        #Drive scope, rates don't carry through a flip so slew over it
+        if self.tracking_mode==self.MODE_RATE and not flipped:
+            commands = self.drive_rate(alt, az, solve_time, lead_time, mount_angles)
+        else:
+            commands = self.stop_rates()
+            commands.append((self.scope_driver.slew_to_altaz_deg, (alt, az)))
 
         self.last_motor_angle = (alt, az)
 
+        #Only the solve counts towards the latency, the command round
+        #trip is measured by the driver
+        tick_latency = time.perf_counter() - tick_start
+        self.solve_latency_s += self.latency_smoothing * (tick_latency - self.solve_latency_s)
+
+        return commands
+
+    def drive_rate(self, alt, az, solve_time, lead_time=0.0, mount_angles=None):
+        """ get the commands for Alt/Az rates to follow the target from the
+        measured mount position, or a slew if it is too far off. MUST be
+        called holding the lock """
+        if mount_angles==None:
+            #Nothing to correct rates against yet
+            commands = self.stop_rates()
+            commands.append((self.scope_driver.slew_to_altaz_deg, (alt, az)))
+            return commands
+
+        mount_alt, mount_az, mount_age = mount_angles
+
+        #The polled position is mount_age old, and alt, az are where the
+        #target will be once this command acts. Carry the mount forward
+        #at the rate it was last sent, so both refer to the same time
+        command = self.rate_controller.last_command
+
+        if command!=None:
+            ahead_s = mount_age + lead_time
+            mount_alt += command[0] * ahead_s
+            mount_az += command[1] * ahead_s
+
+        target_rate = self.solver_state.predict_rate(solve_time + lead_time)
+        rates = self.rate_controller.update((alt, az), target_rate, (mount_alt, mount_az), solve_time)
+
+        if rates==None:
+            commands = self.stop_rates()
+            commands.append((self.scope_driver.slew_to_altaz_deg, (alt, az)))
+            return commands
+
+        if self.rate_controller.needs_send(rates):
+            return [(self.scope_driver.slew_rate_deg, (rates[0], rates[1]))]
+
+        return []
+
+    def get_mount_angles(self):
+        """ (alt, az, age in s) of the mount's latest known position, or
+        None if there isn't one yet. Never waits on a polling driver such
+        as ScopeCommandChannel, other drivers are read directly """
+        get_polled_altaz = getattr(self.scope_driver, "get_polled_altaz", None)
+
+        if get_polled_altaz!=None:
+            return get_polled_altaz()
+
+        alt, az = self.scope_driver.get_altaz_deg()
+
+        return alt, az, 0.0
+
     TrackerState = namedtuple("TrackerState", "local_pos alt az")
 
-    def get_state(self):
-        """ Get the current state information. Trackable position and exact motor angles"""
-        local_pos = self.get_trackable_position()
+    def read_mount_after(self, after_time, timeout_s):
+        """ (alt, az, monotonic time read) of a mount reading started no
+        earlier than after_time, or None if it took longer than timeout_s """
+        wait_for_altaz = getattr(self.scope_driver, "wait_for_altaz", None)
+
+        if wait_for_altaz!=None:
+            return wait_for_altaz(after_time, timeout_s)
+
+        read_start = time.monotonic()
         alt, az = self.scope_driver.get_altaz_deg()
 
-        self.last_motor_angle = (alt, az)
+        return alt, az, 0.5 * (read_start + time.monotonic())
+
+    def get_state(self):
+        """ Get the current state information. Trackable position and exact
+        motor angles, both for the moment the mount was read. Waits for a
+        fresh mount reading, so is meant for calibration captures """
+        capture_time = time.monotonic()
+
+        with self.lock:
+            pos_before = self.get_trackable_position()
+
+        sample = self.read_mount_after(capture_time, self.capture_timeout_s)
+
+        if sample==None:
+            raise RuntimeError("Object tracker timed out reading the mount position")
+
+        alt, az, sample_time = sample
+        after_time = time.monotonic()
+
+        with self.lock:
+            pos_after = self.get_trackable_position()
+
+            self.last_motor_angle = (alt, az)
+            self.last_model_angle = self.motor_to_model_angles(alt, az)
 
         #Might be better if this was an exception
-        if local_pos==None:
+        if pos_before==None or pos_after==None:
             raise RuntimeError("Object tracker cannot get position from trackable")
 
+        #The target keeps moving while we wait on the mount, so take its
+        #position at the time of the reading
+        f = (sample_time - capture_time) / max(after_time - capture_time, 1e-9)
+        f = max(0.0, min(1.0, f))
+
+        local_pos = Position(Position.TYPE_CARTESIAN,
+            x=pos_before.x + f*(pos_after.x - pos_before.x),
+            y=pos_before.y + f*(pos_after.y - pos_before.y),
+            z=pos_before.z + f*(pos_after.z - pos_before.z))
+
         return self.TrackerState(local_pos, alt, az)
 
+    TrackingStatus = namedtuple("TrackingStatus", "label latlong altitude altaz distance offset lead")
+
+    def get_status(self):
+        """ Get a TrackingStatus snapshot of what is being tracked, for display """
+        label = None
+        latlong = (0.0, 0.0)
+        altitude = 0.0
+        altaz = (0.0, 0.0)
+        distance = 0.0
+        lead = self.LeadState(0.0, 0.0, 0.0)
+
+        with self.lock:
+            trackable = self.tracked_object
+
+            if (trackable!=None):
+                pos = trackable.get_position()
+
+                if (pos!=None):
+                    label = trackable.get_name()
+
+                    if (pos.pos_type==pos.TYPE_LATLONG):
+                        latlong = (pos.lat, pos.long)
+                        altitude = pos.height
+
+                    #Calculate object distance
+                    local_pos = self.get_trackable_position()
+
+                    if (local_pos!=None and local_pos.pos_type == local_pos.TYPE_CARTESIAN):
+                        distance = math.sqrt(local_pos.x*local_pos.x + local_pos.y*local_pos.y + local_pos.z*local_pos.z)
+
+                    altaz = self.last_motor_angle
+                    lead = self.last_lead
+
+            return self.TrackingStatus(label, latlong, altitude, altaz, distance, self.tracking_offset, lead)
+
+    def motor_to_model_angles(self, alt, az):
+        """ model space [Alt, Az] of the motor angles alt, az. Removes the
+        tracking offset, and undoes the alt>90 flip if that lands nearer
+        the last solution, as both point the same way """
+        if alt > 0.0:
+            flip_alt = 180.0 - alt
+        else:
+            flip_alt = -180.0 - alt
+
+        candidates = [
+            (alt - self.tracking_offset[0], az - self.tracking_offset[1]),
+            (flip_alt - self.tracking_offset[0], az - 180.0 - self.tracking_offset[1])
+        ]
+
+        costs = PointingSolver.slew_costs(candidates, self.last_model_angle)
+
+        return candidates[int(costs.argmin())]
+
     def get_last_motor_angle(self):
         return self.last_motor_angle
+
+    def get_solver_state(self):
+        return self.solver_state
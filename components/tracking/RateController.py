@@ -0,0 +1,89 @@
+""" module to implement the RateController class """
+
+import math
+
+def wrap_error(err):
+    """ wrap an angle difference (deg) into [-180, 180) """
+    return (err + 180.0) % 360.0 - 180.0
+
+class RateController:
+    """ PI controller turning the target's angles and angular rate, and
+    the mount's measured angles, into Alt/Az rate commands """
+
+    #Proportional gain, deg/s of correction per deg of error
+    kp = 0.5
+
+    #Integral gain, deg/s of correction per deg.s of accumulated error
+    ki = 0.05
+
+    #Bound on the accumulated error (deg.s) per axis, against windup
+    integral_limit = 2.0
+
+    #Fastest rate (deg/s) to command per axis
+    max_rate_deg = 5.0
+
+    #Errors (deg) larger than this are closed with a position slew instead
+    position_slew_error_deg = 2.0
+
+    #Rate changes (deg/s) smaller than this aren't worth a new command
+    deadband_deg = 0.002
+
+    #Error integral [Alt, Az] in deg.s
+    integral = None
+
+    #Time (s) of the last update
+    last_time = None
+
+    #Most recent [dAlt, dAz] rates sent to the mount, None if not rate tracking
+    last_command = None
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.integral = (0.0, 0.0)
+        self.last_time = None
+        self.last_command = None
+
+    def update(self, target_angles, target_rate, mount_angles, time):
+        """ get the [dAlt, dAz] rates (deg/s) to command, or None if the
+        error is too large for rate tracking and a position slew is needed """
+        err = (target_angles[0] - mount_angles[0], wrap_error(target_angles[1] - mount_angles[1]))
+
+        if math.hypot(err[0], err[1]) > self.position_slew_error_deg:
+            #Start integrating afresh once back in range
+            self.integral = (0.0, 0.0)
+            self.last_time = None
+            return None
+
+        dT = 0.0 if self.last_time==None else max(0.0, time - self.last_time)
+        self.last_time = time
+
+        integral = [0.0, 0.0]
+        rates = [0.0, 0.0]
+
+        for axis in range(2):
+            integral[axis] = self.integral[axis] + err[axis] * dT
+            integral[axis] = max(-self.integral_limit, min(self.integral_limit, integral[axis]))
+
+            rate = target_rate[axis] + self.kp * err[axis] + self.ki * integral[axis]
+            rates[axis] = max(-self.max_rate_deg, min(self.max_rate_deg, rate))
+
+        self.integral = (integral[0], integral[1])
+
+        return (rates[0], rates[1])
+
+    def needs_send(self, rates):
+        """ whether rates differ enough from the last command to send,
+        recording them as sent if so """
+        if (self.last_command!=None and abs(rates[0] - self.last_command[0]) < self.deadband_deg
+            and abs(rates[1] - self.last_command[1]) < self.deadband_deg):
+            return False
+
+        self.last_command = rates
+
+        return True
+
+    def is_moving(self):
+        """ whether the mount was last commanded to a non-zero rate """
+        return self.last_command!=None and (self.last_command[0]!=0.0 or self.last_command[1]!=0.0)
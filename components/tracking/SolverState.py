@@ -0,0 +1,106 @@
+""" module to implement the SolverState class """
+
+class SolverState:
+    """ Class to hold the pointing solution history for a
+    tracked object, so each solve can start from where the
+    object is expected to be """
+
+    #Most recent solution [Alt, Az], unwrapped so it stays continuous
+    last_angles = None
+
+    #Time (s) of the most recent solution
+    last_time = None
+
+    #Angular rate [dAlt, dAz] in deg/s
+    rate = None
+
+    #Smoothed angular acceleration [d2Alt, d2Az] in deg/s^2
+    acceleration = None
+
+    #Weight of the newest sample in the acceleration average
+    acceleration_smoothing = 0.3
+
+    #Bound (deg/s^2) on each acceleration sample, as differencing
+    #noisy solutions can give wild values
+    max_acceleration = 5.0
+
+    #Iterations used by the most recent solve
+    iterations = 0
+
+    #Running totals over the life of the track
+    total_iterations = 0
+    num_solves = 0
+
+    #Solutions further apart than this (s) don't give a usable rate
+    max_rate_gap_s = 2.0
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.last_angles = None
+        self.last_time = None
+        self.rate = (0.0, 0.0)
+        self.acceleration = (0.0, 0.0)
+
+        self.iterations = 0
+        self.total_iterations = 0
+        self.num_solves = 0
+
+    def predict(self, time):
+        """ get the expected solution at time, or None if there is
+        no history to go from """
+        if self.last_angles==None:
+            return None
+
+        dT = time - self.last_time
+
+        if dT > self.max_rate_gap_s:
+            return self.last_angles
+
+        return (self.last_angles[0] + self.rate[0]*dT, self.last_angles[1] + self.rate[1]*dT)
+
+    def predict_rate(self, time):
+        """ get the expected angular rate [dAlt, dAz] (deg/s) at time """
+        if self.last_angles==None or time - self.last_time > self.max_rate_gap_s:
+            return (0.0, 0.0)
+
+        dT = max(0.0, time - self.last_time)
+
+        return (self.rate[0] + self.acceleration[0]*dT, self.rate[1] + self.acceleration[1]*dT)
+
+    def update(self, angles, time, iterations):
+        """ record a new solution found at time """
+        angles = (float(angles[0]), float(angles[1]))
+
+        if self.last_angles!=None:
+            dT = time - self.last_time
+
+            if dT > 0.0 and dT <= self.max_rate_gap_s:
+                rate = ((angles[0] - self.last_angles[0]) / dT, (angles[1] - self.last_angles[1]) / dT)
+
+                #Only a rate from the previous solution gives an acceleration
+                if self.num_solves > 1:
+                    a = self.acceleration_smoothing
+                    limit = self.max_acceleration
+
+                    sample = [max(-limit, min(limit, (rate[i] - self.rate[i]) / dT)) for i in range(2)]
+                    self.acceleration = tuple((1.0 - a)*self.acceleration[i] + a*sample[i] for i in range(2))
+
+                self.rate = rate
+            else:
+                self.rate = (0.0, 0.0)
+                self.acceleration = (0.0, 0.0)
+
+        self.last_angles = angles
+        self.last_time = time
+
+        self.iterations = iterations
+        self.total_iterations += iterations
+        self.num_solves += 1
+
+    def get_average_iterations(self):
+        if self.num_solves==0:
+            return 0.0
+
+        return self.total_iterations / self.num_solves
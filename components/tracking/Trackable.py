@@ -15,4 +15,8 @@ class Trackable:
         return "No Name"
 
     def is_tracking(self):
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+    def release(self):
+        """ called once the object is no longer being tracked """
+        pass
\ No newline at end of file
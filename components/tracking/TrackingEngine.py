@@ -0,0 +1,132 @@
+""" module to implement the TrackingEngine class """
+
+import math
+import threading
+import time
+
+class TrackingEngine:
+    """ Class to run an ObjectTracker at a fixed rate on its own
+    thread, so tracking never waits on the GUI. Ticks are scheduled
+    on monotonic deadlines, and a status snapshot is handed to a
+    callback at a lower rate for display """
+
+    #Tracking ticks per second
+    rate_hz = 20.0
+
+    #Seconds between status callbacks
+    publish_interval_s = 0.2
+
+    #Called with (TrackingStatus, engine stats dict) every publish_interval_s
+    callback = None
+
+    def __init__(self, tracker, rate_hz=None, callback=None):
+        self.tracker = tracker
+
+        if rate_hz!=None:
+            self.rate_hz = rate_hz
+
+        self.callback = callback
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.num_ticks = 0
+            self.num_overruns = 0
+
+            #How late (s) ticks started after their deadline
+            self.total_jitter_s = 0.0
+            self.max_jitter_s = 0.0
+
+            #How long (s) ticks took to run
+            self.total_tick_s = 0.0
+            self.max_tick_s = 0.0
+
+            self.start_time = time.monotonic()
+
+    def start(self):
+        if self.thread!=None:
+            return
+
+        self.stop_event.clear()
+        self.reset_stats()
+
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread==None:
+            return
+
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+
+    def loop(self):
+        period = 1.0 / self.rate_hz
+        deadline = time.monotonic()
+        last_publish = None
+
+        while not self.stop_event.is_set():
+            start = time.monotonic()
+            jitter = max(0.0, start - deadline)
+
+            try:
+                self.tracker.run()
+            except Exception as e:
+                print("Tracking tick failed: " + str(e))
+
+            end = time.monotonic()
+
+            deadline += period
+            overrun = end > deadline
+
+            if overrun:
+                #Skip the ticks there's no time left for, rather than
+                #bursting to catch up
+                deadline += math.ceil((end - deadline) / period) * period
+
+            self.record_tick(jitter, end - start, overrun)
+
+            if self.callback!=None and (last_publish==None or end - last_publish >= self.publish_interval_s):
+                last_publish = end
+                self.publish()
+
+            self.stop_event.wait(max(0.0, deadline - time.monotonic()))
+
+    def record_tick(self, jitter, tick_time, overrun):
+        with self.stats_lock:
+            self.num_ticks += 1
+            self.total_jitter_s += jitter
+            self.max_jitter_s = max(self.max_jitter_s, jitter)
+            self.total_tick_s += tick_time
+            self.max_tick_s = max(self.max_tick_s, tick_time)
+
+            if overrun:
+                self.num_overruns += 1
+
+    def publish(self):
+        try:
+            self.callback(self.tracker.get_status(), self.get_stats())
+        except Exception as e:
+            print("Tracking status callback failed: " + str(e))
+
+    def get_stats(self):
+        with self.stats_lock:
+            elapsed = time.monotonic() - self.start_time
+            ticks = max(self.num_ticks, 1)
+
+            return {
+                "target_hz": self.rate_hz,
+                "actual_hz": self.num_ticks / elapsed if elapsed > 0.0 else 0.0,
+                "ticks": self.num_ticks,
+                "overruns": self.num_overruns,
+                "mean_jitter_ms": 1000.0 * self.total_jitter_s / ticks,
+                "max_jitter_ms": 1000.0 * self.max_jitter_s,
+                "mean_tick_ms": 1000.0 * self.total_tick_s / ticks,
+                "max_tick_ms": 1000.0 * self.max_tick_s
+            }
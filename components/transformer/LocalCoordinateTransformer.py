@@ -2,8 +2,117 @@
 from any epsg space to horizon-relative local cartesian 
 coordinates"""
 
+from collections import OrderedDict
 import numpy as np
 import pyproj as proj
+import threading
+import math
+
+#WGS84 ellipsoid
+wgs84_a = 6378137.0
+wgs84_f = 1.0 / 298.257223563
+wgs84_e2 = wgs84_f * (2.0 - wgs84_f)
+
+dtr = math.pi / 180.0
+
+def geodetic_to_ecef(lat, long, height):
+	""" WGS84 Lat/Long (deg)/ellipsoid height (m) to geocentric
+	cartesian, equivalent to epsg:4979 -> epsg:4978 """
+	sin_lat = math.sin(lat*dtr)
+	cos_lat = math.cos(lat*dtr)
+
+	#Prime vertical radius of curvature
+	N = wgs84_a / math.sqrt(1.0 - wgs84_e2*sin_lat*sin_lat)
+
+	return (
+		(N + height) * cos_lat * math.cos(long*dtr),
+		(N + height) * cos_lat * math.sin(long*dtr),
+		(N*(1.0 - wgs84_e2) + height) * sin_lat
+	)
+
+def geodetic_to_ecef_many(lat, long, height):
+	""" Batched geodetic_to_ecef, returns an (N, 3) array """
+	lat = np.asarray(lat, dtype=float) * dtr
+	long = np.asarray(long, dtype=float) * dtr
+	height = np.asarray(height, dtype=float)
+
+	sin_lat = np.sin(lat)
+	cos_lat = np.cos(lat)
+
+	N = wgs84_a / np.sqrt(1.0 - wgs84_e2*sin_lat*sin_lat)
+
+	return np.stack([
+		(N + height) * cos_lat * np.cos(long),
+		(N + height) * cos_lat * np.sin(long),
+		(N*(1.0 - wgs84_e2) + height) * sin_lat
+	], axis=-1)
+
+def enu_basis(lat, long):
+	""" Local East, North, Up basis vectors (as rows) in geocentric
+	cartesian space, Up being the ellipsoid normal at lat, long """
+	sin_lat = math.sin(lat*dtr)
+	cos_lat = math.cos(lat*dtr)
+	sin_long = math.sin(long*dtr)
+	cos_long = math.cos(long*dtr)
+
+	return np.array([
+		[-sin_long, cos_long, 0.0],
+		[-sin_lat*cos_long, -sin_lat*sin_long, cos_lat],
+		[cos_lat*cos_long, cos_lat*sin_long, sin_lat]
+	])
+
+class TransformerCache:
+	""" Bounded LRU cache of pyproj Transformers, keyed by
+	(source CRS, target CRS) strings. Safe to share between threads """
+
+	def __init__(self, max_size=16):
+		self.max_size = max_size
+
+		self.transformers = OrderedDict()
+		self.lock = threading.Lock()
+
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, src_space, dst_space):
+		""" Get a Transformer from src_space to dst_space, building it
+		if it isn't cached """
+		key = (src_space, dst_space)
+
+		with self.lock:
+			transformer = self.transformers.get(key)
+
+			if transformer!=None:
+				self.transformers.move_to_end(key)
+				self.hits += 1
+
+				return transformer
+
+			self.misses += 1
+
+		#Build outside the lock, it's slow
+		transformer = proj.Transformer.from_crs(proj.CRS.from_string(src_space), proj.CRS.from_string(dst_space))
+
+		with self.lock:
+			self.transformers[key] = transformer
+			self.transformers.move_to_end(key)
+
+			while len(self.transformers) > self.max_size:
+				self.transformers.popitem(last=False)
+
+		return transformer
+
+	def get_stats(self):
+		with self.lock:
+			return {
+				"hits": self.hits,
+				"misses": self.misses,
+				"size": len(self.transformers)
+			}
+
+	def clear(self):
+		with self.lock:
+			self.transformers.clear()
 
 class LocalCoordinateTransformer:
 	""" Class to facilitate the transformation of coordinates
@@ -14,13 +123,8 @@ class LocalCoordinateTransformer:
 	local_position = None
 	local_basis = None
 
-	#Target CRS for all transforms, EPSG 4978 cartesian geocentric
-	cart_crs = proj.CRS.from_epsg(4978)
-	#Intermediate CRS for basis calculation, EPSG 4979 WGS84 Lat/Long/ellipsoid height
-	radial_crs = proj.CRS.from_epsg(4979)
-
-	#Cached transform from epsg:4979 to epsg:4978 (wgs84 Lat/Long/h to wgs84 cartesian)
-	rad_cart_transform = proj.Transformer.from_crs(radial_crs, cart_crs)
+	#Transformers from other source spaces into epsg:4979, shared by all instances
+	transformer_cache = TransformerCache()
 
 	def __init__(self, local_position=[0.0, 0.0, 0.0], space="epsg:4979"):
 		self.set_local_position(local_position, space)
@@ -30,77 +134,67 @@ class LocalCoordinateTransformer:
 		must be a valid PROJ String, JSON string with PROJ parameters,
 		CRS WKT string, or an authority string, e.g. epsg:4979 """
 
-		src_crs = proj.CRS.from_string(space)
-		transformer = proj.Transformer.from_crs(src_crs, self.radial_crs)
+		radial_position = (local_position[0], local_position[1], local_position[2] if len(local_position)>2 else 0.0)
+
+		if space!="epsg:4979":
+			transformer = self.transformer_cache.get(space, "epsg:4979")
+
+			#Transform from the source space to radial space
+			radial_position = transformer.transform(radial_position[0], radial_position[1], radial_position[2])
 
-		#Transform from the source space to radial space
-		radial_position = transformer.transform(local_position[0], local_position[1], local_position[2] if len(local_position)>2 else 0)
 		radial_position = np.array(radial_position)
 		print("New Radial Pos: " + str(radial_position))
 
 		#Transform position to cartesian space
-		cart_position = self.rad_cart_transform.transform(radial_position[0], radial_position[1], radial_position[2])
-		cart_position = np.array(cart_position)
+		cart_position = np.array(geodetic_to_ecef(radial_position[0], radial_position[1], radial_position[2]))
 		print("New Cartesian Pos: " + str(cart_position))
 
-		#Get vectors for basis ----------------------
+		#Local horizon (ellipsoidal) basis, from the ellipsoid normal
+		self.local_basis = enu_basis(radial_position[0], radial_position[1])
+		self.local_position = cart_position
 
-		#Get north radial pos
-		point_north_rad = np.array(radial_position) + np.array([1e-5, 0.0, 0.0])
+		print("Local basis (x, y, z): " + str(list(self.local_basis)))
 
-		#Correct for north pole...
-		if point_north_rad[0] > 90.0:
-			point_north_rad[0] = 180.0 - point_north_rad[0]
+	def transform_to_local(self, pos, space="epsg:4979"):
+		src_pos = pos
 
-			if point_north_rad[1] > 0:
-				point_north_rad[1] -= 180.0
-			else:
-				point_north_rad[1] += 180.0
+		if len(src_pos)!=3:
+			print("SRC POS DOES NOT HAVE A HEIGHT!")
 
-		#Get up radial pos
-		point_up_rad = np.array(radial_position) + np.array([0.0, 0.0, 0.1])
+		height = src_pos[2] if len(src_pos)>2 else 0.0
 
-		#Get points in cartesian space
-		point_north = self.rad_cart_transform.transform(point_north_rad[0], point_north_rad[1], point_north_rad[2])
-		point_north = np.array(point_north)
+		if space!="epsg:4979":
+			transformer = self.transformer_cache.get(space, "epsg:4979")
 
-		point_up = self.rad_cart_transform.transform(point_up_rad[0], point_up_rad[1], point_up_rad[2])
-		point_up = np.array(point_up)
+			src_pos = transformer.transform(src_pos[0], src_pos[1], height)
+			height = src_pos[2]
 
-		#Derive local horizon (ellipsoidal) basis vectors
-		v_z = point_up - cart_position
-		v_z /= np.linalg.norm(v_z)
+			print("Src pos transformed to WGS84: " + str(src_pos))
 
-		v_y = point_north - cart_position
-		v_y = (v_y - np.dot(v_y, v_z) * v_z)
-		v_y /= np.linalg.norm(v_y)
-		
-		v_x = np.cross(v_y, v_z)
+		cart_pos = geodetic_to_ecef(src_pos[0], src_pos[1], height)
 
-		print("Local basis (x, y, z): " + str([v_x, v_y, v_z]))
+		v_pos = self.local_basis.dot(np.array(cart_pos) - self.local_position)
 
-		self.local_basis = np.array([v_x, v_y, v_z])
-		self.local_position = np.array(cart_position)
+		return v_pos
 
-	def transform_to_local(self, pos, space="epsg:4979"):
-		src_pos = np.array(pos)
+	def transform_many(self, pos_arr, space="epsg:4979"):
+		""" Batched transform_to_local. pos_arr is an (N, 3) array of
+		positions in space, or (N, 2) for zero height. Returns an
+		(N, 3) array of local coordinates """
+		pos_arr = np.atleast_2d(np.asarray(pos_arr, dtype=float))
 
-		if len(src_pos)!=3:
-			print("SRC POS DOES NOT HAVE A HEIGHT!")
+		src_a = pos_arr[:, 0]
+		src_b = pos_arr[:, 1]
+		src_h = pos_arr[:, 2] if pos_arr.shape[1]>2 else np.zeros(pos_arr.shape[0])
 
 		if space!="epsg:4979":
-			src_crs = proj.CRS.from_string(space)
-			transformer = proj.Transformer.from_crs(src_crs, self.radial_crs)
-
-			src_pos = transformer.transform(src_pos[0], src_pos[1], src_pos[2] if len(src_pos)>2 else 0.0)
+			transformer = self.transformer_cache.get(space, "epsg:4979")
 
-			print("Src pos transformed to WGS84: " + str(src_pos))
+			src_a, src_b, src_h = transformer.transform(src_a, src_b, src_h)
 
-		cart_pos = self.rad_cart_transform.transform(src_pos[0], src_pos[1], src_pos[2])
+		cart_arr = geodetic_to_ecef_many(src_a, src_b, src_h)
 
-		v_pos = self.local_basis.dot(cart_pos - self.local_position)
-
-		return v_pos
+		return np.matmul(cart_arr - self.local_position, self.local_basis.T)
 		
 if __name__=="__main__":
 	trans = LocalCoordinateTransformer(local_position=[83934.30, 5382.06, 0.0], space="epsg:27700")